@@ -8,22 +8,97 @@
 # 7. Save result as PNG with transparency
 
 import sys
-from PIL import Image, ImageDraw, ImageFilter
+import os
+import json
+import io
+import time
+import inspect
+import hashlib
+import shutil
+import struct
+import itertools
+import mmap
+import sqlite3
+import re
+import posixpath
+from urllib.parse import unquote
+from collections import OrderedDict
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageDraw, ImageFilter, ImageChops
+from PIL.PngImagePlugin import PngInfo
 import math
 
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, only the analytic shadow, SDF renderer and NumPy backend need it
+    np = None
+
+# Keep in step with manifest.json; part of every result cache key and output marker
+TOOL_VERSION = '1.5.0'
+
+# tEXt keyword of the marker written into every output PNG
+MARKER_KEY = 'image-rounded-frame'
+
 def hex_to_rgb(hex_color):
     """Convert hex color string to RGB tuple"""
     hex_color = hex_color.lstrip('#')
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
-def apply_effects(input_path, output_path, radius_value, unit,
-                  shadow_enabled=False, shadow_color="#000000", shadow_blur=10, shadow_offset=5,
-                  border_enabled=False, border_color="#cccccc", border_width=2, border_style="solid"):
-    # Load image
-    img = Image.open(input_path).convert("RGBA")
-    w, h = img.size
+def intersect_box(a, b):
+    """Intersection of two (x0, y0, x1, y1) boxes, or None if they do not overlap"""
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    return box if box[0] < box[2] and box[1] < box[3] else None
 
-    # Calculate radius
+def union_box(boxes):
+    """Smallest box containing every given (x0, y0, x1, y1) box"""
+    x0s, y0s, x1s, y1s = zip(*boxes)
+    return min(x0s), min(y0s), max(x1s), max(y1s)
+
+def subtract_box(box, cut):
+    """Split box minus cut into at most four non-overlapping boxes"""
+    inner = intersect_box(box, cut)
+    if inner is None:
+        return [box]
+    x0, y0, x1, y1 = box
+    cx0, cy0, cx1, cy1 = inner
+    parts = [(x0, y0, x1, cy0), (x0, cy1, x1, y1), (x0, cy0, cx0, cy1), (cx1, cy0, x1, cy1)]
+    return [part for part in parts if part[0] < part[2] and part[1] < part[3]]
+
+def muldiv255(a, b):
+    """Integer a * b / 255 with the same rounding Pillow uses when blending"""
+    t = a * b + 128
+    return ((t >> 8) + t) >> 8
+
+def colorize_shadow(alpha, color):
+    """Turn a blurred shadow alpha into the RGBA layer it produces when pasted onto an empty canvas.
+
+    The shadow used to be a solid-colour RGBA image pasted through its own
+    alpha, which scales every channel (alpha included) by that alpha. Doing
+    the same with per-channel lookup tables gives identical pixels without
+    ever blurring the constant colour channels.
+    """
+    bands = [alpha.point([muldiv255(c, v) for v in range(256)]) for c in hex_to_rgb(color)]
+    bands.append(alpha.point([muldiv255(v, v) for v in range(256)]))
+    return Image.merge('RGBA', bands)
+
+def may_have_alpha(img):
+    """Whether an opened (not necessarily decoded) image can contain transparency"""
+    return img.mode in ('RGBA', 'RGBa', 'LA', 'La', 'PA') or 'transparency' in img.info
+
+def load_image(input_path):
+    """Decode an image as RGBA; also report whether the source could contain transparency"""
+    img = Image.open(input_path)
+    has_alpha = may_have_alpha(img)
+    if img.mode == 'RGBA':
+        # Already the working mode: decode in place instead of converting to a copy
+        img.load()
+        return img, has_alpha
+    return img.convert("RGBA"), has_alpha
+
+def calculate_radius(w, h, radius_value, unit):
+    """Convert a radius in percent or px into pixels, clamped to half the smaller side"""
     base_dimension = min(w, h)
     max_radius = base_dimension / 2
 
@@ -33,124 +108,2233 @@ def apply_effects(input_path, output_path, radius_value, unit,
         radius_px = radius_value
 
     radius_px = min(radius_px, max_radius)
-    radius_px = max(0, radius_px)
-
-    # Create the final canvas (larger if shadow or border is enabled)
-    shadow_padding = shadow_blur + shadow_offset + 10 if shadow_enabled else 0
-    border_padding = border_width if border_enabled else 0
-    canvas_padding = shadow_padding + border_padding
-    canvas_w = w + canvas_padding * 2
-    canvas_h = h + canvas_padding * 2
-    canvas = Image.new('RGBA', (canvas_w, canvas_h), (0, 0, 0, 0))
-
-    # Position of original image on canvas (centered with padding)
-    img_x = canvas_padding
-    img_y = canvas_padding
-
-    # Create mask for rounded corners
-    mask = Image.new('L', (w, h), 0)
+    return max(0, radius_px)
+
+def rounded_mask(size, radius, antialias=1):
+    """Draw the full 'L' rounded-rectangle mask for an image of the given size.
+
+    With ``antialias`` > 1 the mask is drawn that many times larger and
+    reduced, giving anti-aliased edges instead of Pillow's aliased ones.
+    """
+    w, h = size
+    mask = Image.new('L', (w * antialias, h * antialias), 0)
     draw = ImageDraw.Draw(mask)
-    draw.rounded_rectangle([(0, 0), (w, h)], radius=int(radius_px), fill=255)
+    draw.rounded_rectangle([(0, 0), mask.size], radius=radius * antialias, fill=255)
+    return mask.reduce(antialias) if antialias > 1 else mask
 
-    # Apply rounded corners to image
-    rounded_img = Image.new('RGBA', (w, h), (0, 0, 0, 0))
-    rounded_img.paste(img, (0, 0), mask)
+def stamp_bytes(item):
+    """Bytes held by a cached 'L' mask, bare or as an (x, y, mask) piece, or by a NumPy array"""
+    if isinstance(item, tuple):
+        item = item[-1]
+    if np is not None and isinstance(item, np.ndarray):
+        return item.nbytes
+    return item.width * item.height
 
-    # Apply shadow if enabled
+class StampCache:
+    """LRU cache for corner stamps, bounded by the total bytes of the cached masks.
+
+    One instance lives for the whole process, so every job of a batch or a
+    --serve session reuses the stamps of radii it has already seen.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, build):
+        """Return the cached value for key, calling build() on a miss"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+        self.misses += 1
+        value = build()
+        size = sum(stamp_bytes(item) for item in value)
+        if size <= self.max_bytes:
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        """Drop every cached stamp (counters are kept)"""
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """Return the cache counters as a JSON-serialisable dict"""
+        return {'entries': len(self._entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+STAMP_CACHE = StampCache()
+
+def corner_stamp(radius, antialias=1):
+    """Return the four (radius + 1)-sized corner tiles (TL, TR, BL, BR) of a rounded mask.
+
+    Pillow rasterises the corners the same way wherever the rectangle sits, so
+    they are cut from one small stamp. Its corners are not exact mirror images
+    of each other (the rectangle box includes its far edge), hence four tiles.
+    """
+    def build():
+        tile = radius + 1
+        stamp_size = 2 * tile + 1
+        stamp = rounded_mask((stamp_size, stamp_size), radius, antialias)
+        far = stamp_size - tile
+        return tuple(stamp.crop((sx, sy, sx + tile, sy + tile))
+                     for sx, sy in ((0, 0), (far, 0), (0, far), (far, far)))
+    return STAMP_CACHE.get((radius, 0, antialias), build)
+
+def ring_stamp(radius, width, antialias=1):
+    """Return the four corner tiles of a ``width``-pixel border ring around a rounded mask.
+
+    The ring is the rounded rectangle of radius ``radius + width`` around the
+    image, minus the image's own rounded mask; tiles are (radius + width + 1) wide.
+    """
+    def build():
+        outer = corner_stamp(radius + width, antialias)
+        inner = corner_stamp(radius, antialias)
+        tiles = []
+        for outer_tile, inner_tile, offset in zip(outer, inner, ((width, width), (0, width), (width, 0), (0, 0))):
+            cut = Image.new('L', outer_tile.size, 0)
+            cut.paste(inner_tile, offset)
+            tiles.append(ImageChops.multiply(outer_tile, ImageChops.invert(cut)))
+        return tuple(tiles)
+    return STAMP_CACHE.get((radius, width, antialias), build)
+
+def ring_tiles(size, radius, width, antialias=1, renderer='stamp'):
+    """Describe the border ring around a w x h rounded image as (tiles, strips).
+
+    Coordinates are relative to the ring's outer box, which is ``width``
+    pixels larger than the image on every side. ``tiles`` are (x, y, mask)
+    corner pieces, ``strips`` are boxes where the ring is solid; the ring is
+    empty everywhere else.
+    """
+    w, h = size
+    outer_w, outer_h = w + 2 * width, h + 2 * width
+    use_sdf = renderer == 'sdf' and np is not None
+    if 2 * radius >= min(w, h) - 1:
+        # Pill/ellipse shapes have no straight edges to split off
+        if use_sdf:
+            distance = sdf_distance((-width, -width, w + width, h + width), size, radius)
+            return [(0, 0, sdf_mask(sdf_coverage(distance - width) - sdf_coverage(distance)))], []
+        cut = Image.new('L', (outer_w, outer_h), 0)
+        cut.paste(rounded_mask(size, radius, antialias), (width, width))
+        ring = ImageChops.multiply(rounded_mask((outer_w, outer_h), radius + width, antialias), ImageChops.invert(cut))
+        return [(0, 0, ring)], []
+    tile = radius + width + 1
+    stamps = sdf_stamp(radius, width)[4:] if use_sdf else ring_stamp(radius, width, antialias)
+    tiles = list(zip((0, outer_w - tile, 0, outer_w - tile), (0, 0, outer_h - tile, outer_h - tile), stamps))
+    strips = [(tile, 0, outer_w - tile, width), (tile, outer_h - width, outer_w - tile, outer_h),
+              (0, tile, width, outer_h - tile), (outer_w - width, tile, outer_w, outer_h - tile)]
+    return tiles, [box for box in strips if box[0] < box[2] and box[1] < box[3]]
+
+BORDER_PATTERNS = {'dashed': (3, 2), 'dotted': (1, 2)}
+
+def ring_centerline(size, radius, width):
+    """Return (outer_radius, centre_radius, straight_w, straight_h, perimeter) of a border ring.
+
+    The dash pattern runs along the line halfway through the ring, which is
+    a rounded rectangle of radius ``radius + width / 2`` sharing the ring's
+    arc centres. Pill shapes are clamped so the straight parts never go negative.
+    """
+    w, h = size
+    outer_w, outer_h = w + 2 * width, h + 2 * width
+    outer = min(radius + width, outer_w / 2, outer_h / 2)
+    centre = max(0.0, outer - width / 2)
+    straight_w, straight_h = outer_w - 2 * outer, outer_h - 2 * outer
+    return outer, centre, straight_w, straight_h, 2 * (straight_w + straight_h) + 2 * math.pi * centre
+
+def dash_period(perimeter, width, style):
+    """Return (dash, period) along the centre line, stretched so the pattern closes on itself"""
+    dash, gap = BORDER_PATTERNS.get(style, BORDER_PATTERNS['dotted'])
+    count = max(1, round(perimeter / ((dash + gap) * width)))
+    period = perimeter / count
+    return period * dash / (dash + gap), period
+
+def pattern_coverage(xs, ys, size, radius, width, style):
+    """Vectorised dash coverage (0..1) at ring-local points xs, ys.
+
+    Every point is mapped to its arc length ``s`` along the ring's centre
+    line, clockwise from the start of the top edge, and its distance ``t``
+    across it. Dashes are runs of ``s``; dots are discs around the middle of each run.
+    """
+    outer, centre, straight_w, straight_h, perimeter = ring_centerline(size, radius, width)
+    outer_w, outer_h = size[0] + 2 * width, size[1] + 2 * width
+    cx = np.clip(xs, outer, outer_w - outer)
+    cy = np.clip(ys, outer, outer_h - outer)
+    dx, dy = xs - cx, ys - cy
+    t = np.hypot(dx, dy) - centre
+    angle = np.arctan2(dy, dx)
+    quarter = centre * math.pi / 2
+    s = np.select(
+        [(dx == 0) & (dy < 0), (dx > 0) & (dy < 0), (dx > 0) & (dy == 0), (dx > 0) & (dy > 0),
+         (dx == 0) & (dy > 0), (dx < 0) & (dy > 0), (dx < 0) & (dy == 0)],
+        [cx - outer,
+         straight_w + centre * (angle + math.pi / 2),
+         straight_w + quarter + (cy - outer),
+         straight_w + quarter + straight_h + centre * angle,
+         straight_w + 2 * quarter + straight_h + (outer_w - outer - cx),
+         2 * straight_w + 2 * quarter + straight_h + centre * (angle - math.pi / 2),
+         2 * straight_w + 3 * quarter + straight_h + (outer_h - outer - cy)],
+        2 * straight_w + 3 * quarter + 2 * straight_h + centre * (angle + math.pi))
+    dash, period = dash_period(perimeter, width, style)
+    along = np.mod(s, period)
+    if style == 'dashed':
+        return (along < dash).astype(np.float32)
+    return ((along - dash / 2) ** 2 + t ** 2 <= (width / 2) ** 2).astype(np.float32)
+
+def pattern_mask(box, size, radius, width, style, antialias=1):
+    """Rasterise the dash coverage of a ring-local box in one NumPy pass"""
+    x0, y0, x1, y1 = box
+    offsets = (np.arange(antialias) + 0.5) / antialias
+    xs = (np.arange(x0, x1)[:, None] + offsets).ravel()
+    ys = (np.arange(y0, y1)[:, None] + offsets).ravel()
+    coverage = pattern_coverage(xs[None, :], ys[:, None], size, radius, width, style)
+    if antialias > 1:
+        coverage = coverage.reshape(y1 - y0, antialias, x1 - x0, antialias).mean(axis=(1, 3))
+    return Image.fromarray(np.rint(coverage * 255).astype(np.uint8), 'L')
+
+def centerline_point(s, size, radius, width):
+    """Point at arc length ``s`` along the ring's centre line (ring-local coordinates)"""
+    outer, centre, straight_w, straight_h, perimeter = ring_centerline(size, radius, width)
+    right, bottom = size[0] + 2 * width - outer, size[1] + 2 * width - outer
+    quarter = centre * math.pi / 2
+    s %= perimeter
+    for length, point in ((straight_w, lambda d: (outer + d, outer - centre)),
+                          (quarter, lambda d: arc_point(right, outer, centre, -math.pi / 2, d)),
+                          (straight_h, lambda d: (right + centre, outer + d)),
+                          (quarter, lambda d: arc_point(right, bottom, centre, 0, d)),
+                          (straight_w, lambda d: (right - d, bottom + centre)),
+                          (quarter, lambda d: arc_point(outer, bottom, centre, math.pi / 2, d)),
+                          (straight_h, lambda d: (outer - centre, bottom - d)),
+                          (quarter, lambda d: arc_point(outer, outer, centre, math.pi, d))):
+        if s <= length:
+            return point(s)
+        s -= length
+    return outer, outer - centre
+
+def arc_point(cx, cy, radius, start, distance):
+    """Point ``distance`` along a clockwise arc of ``radius`` starting at angle ``start``"""
+    angle = start + (distance / radius if radius else 0)
+    return cx + radius * math.cos(angle), cy + radius * math.sin(angle)
+
+def draw_pattern(size, radius, width, style):
+    """Draw the dashes over the whole ring box with ImageDraw (used when NumPy is missing)"""
+    outer_size = (size[0] + 2 * width, size[1] + 2 * width)
+    perimeter = ring_centerline(size, radius, width)[4]
+    dash, period = dash_period(perimeter, width, style)
+    pattern = Image.new('L', outer_size, 0)
+    draw = ImageDraw.Draw(pattern)
+    for i in range(round(perimeter / period)):
+        start = i * period
+        if style == 'dashed':
+            steps = max(1, int(dash))
+            points = [centerline_point(start + dash * k / steps, size, radius, width) for k in range(steps + 1)]
+            draw.line(points, fill=255, width=width, joint='curve')
+        else:
+            x, y = centerline_point(start + dash / 2, size, radius, width)
+            draw.ellipse([x - width / 2, y - width / 2, x + width / 2, y + width / 2], fill=255)
+    return pattern
+
+def pattern_tiles(size, radius, width, style, antialias=1, renderer='stamp'):
+    """Return (x, y, mask) pieces of a dashed or dotted border ring, in ring-local coordinates.
+
+    The pattern runs around the whole perimeter, corner arcs included. The
+    pieces are the ring's own strips and corner tiles multiplied by the
+    dash coverage, so they are cached per geometry and style.
+    """
+    def build():
+        tiles, strips = ring_tiles(size, radius, width, antialias, renderer)
+        pieces = tiles + [(x0, y0, Image.new('L', (x1 - x0, y1 - y0), 255)) for x0, y0, x1, y1 in strips]
+        drawn = draw_pattern(size, radius, width, style) if np is None else None
+        result = []
+        for x, y, ring in pieces:
+            box = (x, y, x + ring.width, y + ring.height)
+            dashes = drawn.crop(box) if drawn is not None else pattern_mask(box, size, radius, width, style, antialias)
+            result.append((x, y, ImageChops.multiply(ring, dashes)))
+        return tuple(result)
+    return STAMP_CACHE.get(('pattern', size, radius, width, style, antialias, renderer), build)
+
+def corner_tiles(size, radius, antialias=1, renderer='stamp'):
+    """Return (x, y, mask) tiles holding every pixel where rounded_mask(size, radius) is not 255.
+
+    Everything outside the returned tiles is solid 255. The 'sdf' renderer
+    returns the same layout with coverage taken from the signed distance.
+    """
+    w, h = size
+    if radius <= 0:
+        return []
+    use_sdf = renderer == 'sdf' and np is not None
+    if 2 * radius >= min(w, h) - 1:
+        # Pillow draws this as a pill/ellipse, there is no solid cross to skip
+        if use_sdf:
+            return [(0, 0, sdf_mask(sdf_coverage(sdf_distance((0, 0, w, h), size, radius))))]
+        return [(0, 0, rounded_mask(size, radius, antialias))]
+    tile = radius + 1
+    stamps = sdf_stamp(radius)[:4] if use_sdf else corner_stamp(radius, antialias)
+    return list(zip((0, w - tile, 0, w - tile), (0, 0, h - tile, h - tile), stamps))
+
+# Lookup table turning a mask into "255 where the mask is fully outside"
+OUTSIDE_LUT = [255] + [0] * 255
+
+def mask_region(tiles, box):
+    """Return the part of a tile-described rounded mask inside box as an 'L' image"""
+    x0, y0, x1, y1 = box
+    region = Image.new('L', (x1 - x0, y1 - y0), 255)
+    for x, y, tile in tiles:
+        region.paste(tile, (x - x0, y - y0))
+    return region
+
+def blur_support(sigma):
+    """Distance beyond which GaussianBlur(sigma) cannot move a value.
+
+    Pillow approximates the Gaussian with three box blurs whose radius never
+    exceeds sigma, so each pass reaches at most ceil(sigma) + 1 pixels.
+    """
+    return 3 * (int(math.ceil(sigma)) + 1)
+
+SHADOW_QUALITIES = ('exact', 'fast', 'fastest', 'analytic')
+
+# The reduced tiers only blur images whose short side spans this many sigmas
+SHADOW_REDUCE_SPAN = 20
+
+def blur_factor(sigma, quality, size):
+    """Downscale factor the quality tier blurs at (1 for a full-resolution blur).
+
+    The reduced tiers need sigma of a few pixels to hide the lost precision.
+    Pillow re-clamps at the image edges after each box pass, which a reduced
+    copy cannot follow once the blur is a sizeable share of the image, so
+    a ``size`` whose short side is under SHADOW_REDUCE_SPAN sigmas (a small
+    image, cheap to blur exactly) keeps the full resolution.
+    """
+    if quality not in SHADOW_QUALITIES:
+        raise ValueError(f"Unknown shadow quality: {quality}")
+    factor = {'exact': 1, 'fast': 2, 'fastest': 4, 'analytic': 1}[quality]
+    if min(size) < SHADOW_REDUCE_SPAN * sigma:
+        return 1
+    return max(1, min(factor, int(sigma // 4)))
+
+def blur_mask(mask, sigma, quality='exact', size=None):
+    """Gaussian-blur an 'L' mask at the requested quality tier.
+
+    'exact' is Pillow's GaussianBlur at full resolution. 'fast' blurs a 2x
+    reduced copy and 'fastest' approximates the Gaussian with two box blurs
+    on a 4x reduced copy; both are scaled back up bilinearly. Soft shadows
+    hide the lost precision, so the reduced tiers only kick in once sigma is
+    large enough for it not to show. 'analytic' only differs for plain
+    rounded corners, so any other mask falls back to the exact blur. A mask
+    cut from a larger one passes that one's ``size`` to pick the same tier.
+    """
+    factor = blur_factor(sigma, quality, size or mask.size)
+    if factor <= 1:
+        return mask.filter(ImageFilter.GaussianBlur(sigma))
+    small = mask.reduce(factor)
+    small_sigma = sigma / factor
+    if quality == 'fastest':
+        # Two box passes of this radius have the variance of the target Gaussian
+        box_radius = (math.sqrt(6 * small_sigma * small_sigma + 1) - 1) / 2
+        small = small.filter(ImageFilter.BoxBlur(box_radius)).filter(ImageFilter.BoxBlur(box_radius))
+    else:
+        small = small.filter(ImageFilter.GaussianBlur(small_sigma))
+    # Scale by exactly the factor, so a region cut on the factor's grid
+    # comes back on the same pixels as the whole mask would
+    return small.resize(mask.size, Image.BILINEAR, box=(0, 0, mask.width / factor, mask.height / factor))
+
+def shadow_tiles(size, tiles, sigma, quality='exact', visible=None):
+    """Return (x, y, alpha) tiles of the blurred rounded mask wherever it is not solid 255.
+
+    The blur clamps at the image edges, so away from the corners the blurred
+    mask stays 255. Each corner tile is blurred on its own with enough margin
+    that the result is identical to blurring the whole mask. ``visible``
+    boxes, if given, are the only pixels the caller will show; the analytic
+    tier evaluates nothing else, the blurring tiers ignore them.
+    """
+    w, h = size
+    if quality == 'analytic' and np is not None and len(tiles) == 4:
+        return analytic_shadow_tiles(size, tiles, sigma, visible)
+    factor = blur_factor(sigma, quality, size)
+    # A reduced blur reaches its own support in reduced pixels plus one for
+    # the bilinear upscale, and its sources start on the factor's grid so
+    # that they reduce to the same pixels as the whole mask
+    support = blur_support(sigma) if factor == 1 else factor * (blur_support(sigma / factor) + 1)
+    bounds = (0, 0, w, h)
+
+    def grow(box, by):
+        return intersect_box(bounds, (box[0] - by, box[1] - by, box[2] + by, box[3] + by))
+
+    def align(box):
+        x0, y0, x1, y1 = box
+        return (x0 - x0 % factor, y0 - y0 % factor, min(w, x1 + -x1 % factor), min(h, y1 + -y1 % factor))
+
+    regions = [grow((x, y, x + tile.width, y + tile.height), support) for x, y, tile in tiles]
+    sources = [align(grow(region, support + factor)) for region in regions]
+    if sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in sources) >= w * h:
+        # Corners overlap too much to be worth splitting
+        return [(0, 0, blur_mask(mask_region(tiles, bounds), sigma, quality))] if tiles else []
+    result = []
+    for region, source in zip(regions, sources):
+        blurred = blur_mask(mask_region(tiles, source), sigma, quality, size)
+        x0, y0 = source[0], source[1]
+        result.append((region[0], region[1],
+                       blurred.crop((region[0] - x0, region[1] - y0, region[2] - x0, region[3] - y0))))
+    return result
+
+def gaussian_cdf_table(sigma, low, high):
+    """Return P[d - low] = mass of a unit Gaussian left of (d - 0.5) / sigma, for integer d in [low, high]"""
+    scale = 1 / (max(sigma, 1e-6) * math.sqrt(2))
+    return np.array([0.5 * (1 + math.erf((d - 0.5) * scale)) for d in range(low, high + 1)])
+
+def falloff_regions(size, areas, visible=None):
+    """Boxes over which a closed-form shadow falloff is evaluated.
+
+    ``areas`` are the boxes each corner's hole can reach. Without ``visible``
+    that is every reached pixel of the w x h mask, as a single box once the
+    areas overlap too much to split. With ``visible`` it is only the reached
+    part of each visible box, so the pixels the image will cover cost nothing;
+    the parts a box shares with several areas stay apart unless they overlap
+    enough that their union is smaller, so a long strip between two corners
+    is only evaluated at its ends.
+    """
+    w, h = size
+    bounds = (0, 0, w, h)
+    areas = [area for area in (intersect_box(bounds, area) for area in areas) if area]
+    if visible is None:
+        if sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in areas) >= w * h:
+            return [bounds]
+        return areas
+    regions = []
+    for box in visible:
+        parts = [part for part in (intersect_box(box, area) for area in areas) if part]
+        if not parts:
+            continue
+        union = union_box(parts)
+        if (union[2] - union[0]) * (union[3] - union[1]) <= sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in parts):
+            regions.append(union)
+        else:
+            regions += parts
+    return regions
+
+# Largest error, as a fraction of full coverage, that dropping a corner's
+# blurred singular components may add: a tenth of one 8-bit level
+HOLE_TOLERANCE = 0.1 / 255
+
+def hole_components(hole):
+    """Singular components (u * s, v) of a corner's hole, cached with the corner stamps"""
+    def build():
+        u, scale, vt = np.linalg.svd(hole)
+        return u * scale, vt.T
+    return STAMP_CACHE.get(('svd', hole.shape[0], hashlib.sha1(hole.tobytes()).digest()), build)
+
+def corner_hole_blur(hole, xs, ys, sigma):
+    """Gaussian blur of one corner's 'hole' (1 - mask), sampled at pixel offsets xs, ys from its outer edges.
+
+    ``hole`` is the corner tile oriented as a top-left corner. Because the
+    shadow blur clamps at the image edges, the tile's outer row and column
+    continue to infinity, and its outer pixel fills the whole quadrant
+    beyond. Every part is separable, so the blur is a few small matrix
+    products of closed-form erf weights. An output much larger than the
+    tile goes through the tile's singular components instead: the blur
+    flattens the fine ones, so only those still worth more than
+    HOLE_TOLERANCE enter the full-size product, fewer the wider the blur.
+    """
+    k = hole.shape[0]
+    low = -int(max(xs.max(), ys.max())) - 1
+    high = k + 1 - int(min(xs.min(), ys.min()))
+    table = gaussian_cdf_table(sigma, low, high)
+
+    def weights(offsets):
+        # Column j of the tile covers [j, j + 1); pixel p samples its centre p + 0.5
+        d = np.arange(k)[None, :] - offsets[:, None]
+        inside = table[d + 1 - low] - table[d - low]
+        beyond = table[-offsets - low]
+        return inside, beyond
+
+    wx, beyond_x = weights(xs)
+    wy, beyond_y = weights(ys)
+    if len(xs) * len(ys) > 8 * k * k:
+        u, v = hole_components(hole)
+        left = wy @ u
+        right = wx @ v
+        # A component adds at most the product of its largest blurred values;
+        # keep the shortest prefix whose dropped tail stays under the tolerance
+        bound = np.abs(left).max(axis=0) * np.abs(right).max(axis=0)
+        keep = int(np.count_nonzero(np.cumsum(bound[::-1])[::-1] > HOLE_TOLERANCE))
+        left, right = left[:, :keep], right[:, :keep]
+    else:
+        left, right = wy @ hole, wx
+    left = np.column_stack([left, wy @ hole[:, 0], beyond_y])
+    right = np.column_stack([right, beyond_x, wx @ hole[0, :] + hole[0, 0] * beyond_x])
+    return left @ right.T
+
+def analytic_shadow_tiles(size, tiles, sigma, visible=None):
+    """shadow_tiles() computed in closed form instead of with GaussianBlur.
+
+    The blurred mask is 255 minus the blurred holes at the four corners; the
+    corner stamps serve as the lookup table for the holes' shape. Each hole
+    is only evaluated within 4 sigma of its tile. With ``visible`` (see
+    falloff_regions()) the work is bounded by the visible pixels near the
+    corners, whatever the blur; without it, it follows the area the falloff
+    covers, like Pillow's blurs.
+    """
+    w, h = size
+    reach = int(math.ceil(4 * sigma)) + 1
+    holes = []
+    for (x, y, tile), flip_x, flip_y in zip(tiles, (False, True, False, True), (False, False, True, True)):
+        hole = 1 - np.asarray(tile, dtype=np.float64) / 255
+        hole = np.ascontiguousarray(hole[::-1 if flip_y else 1, ::-1 if flip_x else 1])
+        holes.append(((x - reach, y - reach, x + tile.width + reach, y + tile.height + reach), hole, flip_x, flip_y))
+
+    result = []
+    for x0, y0, x1, y1 in falloff_regions(size, [area for area, _, _, _ in holes], visible):
+        covered = np.zeros((y1 - y0, x1 - x0))
+        for area, hole, flip_x, flip_y in holes:
+            part = intersect_box((x0, y0, x1, y1), area)
+            if part is None:
+                continue
+            px = np.arange(part[0], part[2])
+            py = np.arange(part[1], part[3])
+            xs = (w - 1 - px) if flip_x else px
+            ys = (h - 1 - py) if flip_y else py
+            covered[part[1] - y0:part[3] - y0, part[0] - x0:part[2] - x0] += corner_hole_blur(hole, xs, ys, sigma)
+        alpha = np.clip(np.rint(255 * (1 - covered)), 0, 255).astype(np.uint8)
+        result.append((x0, y0, Image.fromarray(alpha, 'L')))
+    return result
+
+RENDERERS = ('stamp', 'sdf')
+
+def sdf_distance(box, size, radius):
+    """Signed distance from the pixel centres of box to the edge of a w x h rounded rectangle.
+
+    ``box`` is in image coordinates and may reach outside the image;
+    distances are negative inside the rectangle.
+    """
+    w, h = size
+    radius = min(radius, w / 2, h / 2)
+    qx = np.abs(np.arange(box[0], box[2]) + 0.5 - w / 2)[None, :] - (w / 2 - radius)
+    qy = np.abs(np.arange(box[1], box[3]) + 0.5 - h / 2)[:, None] - (h / 2 - radius)
+    return corner_distance(qx, qy, radius)
+
+def corner_distance(qx, qy, radius):
+    """Distance to a rounded corner, from offsets qx, qy past the arc centre"""
+    return np.hypot(np.maximum(qx, 0), np.maximum(qy, 0)) + np.minimum(np.maximum(qx, qy), 0) - radius
+
+def sdf_coverage(distance):
+    """Approximate pixel coverage (0..1) of the inside of an edge at the given signed distance"""
+    return np.clip(0.5 - distance, 0, 1)
+
+def sdf_mask(coverage):
+    """Turn a 0..1 coverage array into an 'L' mask"""
+    return Image.fromarray(np.rint(coverage * 255).astype(np.uint8), 'L')
+
+def sdf_stamp(radius, width=0):
+    """Return the corner tiles (TL, TR, BL, BR) of the mask, then of the ring, from one distance field.
+
+    Only the top-left corner is evaluated: the distance to a rounded corner
+    is exactly symmetric, so the other corners are its mirror images. The
+    ring is the band 0 < d < width around the image, whose outer edge is the
+    rounded rectangle of radius ``radius + width``. Coverage is anti-aliased
+    by construction, with no supersampling.
+    """
+    def build():
+        offsets = radius - (np.arange(radius + width + 1) + 0.5 - width)
+        distance = corner_distance(offsets[None, :], offsets[:, None], radius)
+        inside = sdf_coverage(distance)
+        fields = [inside[width:, width:]]
+        if width:
+            fields.append(sdf_coverage(distance - width) - inside)
+        return tuple(sdf_mask(field[::flip_y, ::flip_x]) for field in fields
+                     for flip_x, flip_y in ((1, 1), (-1, 1), (1, -1), (-1, -1)))
+    return STAMP_CACHE.get(('sdf', radius, width), build)
+
+def gaussian_cdf(x):
+    """Standard normal CDF of an array (Abramowitz-Stegun erf approximation, error below 2e-7)"""
+    z = np.abs(x) / math.sqrt(2)
+    t = 1 / (1 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return 0.5 * (1 + np.sign(x) * (1 - poly * np.exp(-z * z)))
+
+def sdf_hole_blur(xs, ys, radius, sigma):
+    """Gaussian blur of one corner's hole at pixel centres xs, ys measured from its two outer edges.
+
+    The blur clamps at the image edges, so the hole is what the SDF mask
+    leaves outside the arc when sampled at clamped pixel centres: rows
+    above the first centre repeat the first row, and rows whose arc lies
+    within half a pixel of the edge have no hole at all. Across x each row
+    of the hole is a half-line ending at the SDF's zero crossing, whose
+    blur is an erf; the rows are then summed by Gauss-Legendre quadrature.
+    Every term is a product of a function of x and one of y, so the erfs
+    are taken once per column and row and the sum is one matrix product.
+    """
+    def edge(y):
+        return radius - math.sqrt(max(0.0, radius * radius - (radius - y) ** 2))
+
+    if edge(0.5) <= 0.5:
+        return np.zeros((len(ys), len(xs)))
+    half = (radius - math.sqrt(radius - 0.25) - 0.5) / 2
+    count = min(32, max(4, math.ceil(2 * radius / sigma)))
+    nodes, weights = STAMP_CACHE.get(('legendre', count), lambda: np.polynomial.legendre.leggauss(count))
+    rows = 0.5 + half * (1 + nodes)
+    edges = np.array([edge(0.5)] + [edge(y) for y in rows])
+    left = np.column_stack([gaussian_cdf((0.5 - ys) / sigma)] +
+                           [np.exp(-(y - ys) ** 2 / (2 * sigma * sigma)) * (weight * half / (sigma * math.sqrt(2 * math.pi)))
+                            for y, weight in zip(rows, weights)])
+    right = gaussian_cdf((edges[None, :] - xs[:, None]) / sigma)
+    return left @ right.T
+
+def sdf_shadow_tiles(size, radius, sigma, visible=None):
+    """shadow_tiles() for the SDF renderer, evaluated in closed form from the corner geometry.
+
+    A distance profile alone, Phi(-d / sigma), is exact for straight edges
+    but overshoots badly once sigma exceeds the radius, so the corners'
+    holes are integrated instead (see sdf_hole_blur). The holes of the four
+    corners never overlap, so their blurs add up. Like the analytic tier,
+    each hole is only evaluated within 4 sigma of its corner and, with
+    ``visible``, only on the visible pixels (see falloff_regions()).
+    """
+    w, h = size
+    radius = min(radius, w / 2, h / 2)
+    tile = int(math.ceil(radius)) + 1
+    if radius <= 0:
+        return []
+    if sigma < 0.5:
+        return corner_tiles(size, int(radius), renderer='sdf')
+    reach = int(math.ceil(4 * sigma)) + 1
+    corners = [((x - reach, y - reach, x + tile + reach, y + tile + reach), flip_x, flip_y)
+               for x, y, flip_x, flip_y in ((0, 0, False, False), (w - tile, 0, True, False),
+                                            (0, h - tile, False, True), (w - tile, h - tile, True, True))]
+    result = []
+    for x0, y0, x1, y1 in falloff_regions(size, [area for area, _, _ in corners], visible):
+        covered = np.zeros((y1 - y0, x1 - x0))
+        for area, flip_x, flip_y in corners:
+            part = intersect_box((x0, y0, x1, y1), area)
+            if part is None:
+                continue
+            xs = np.arange(part[0], part[2]) + 0.5
+            ys = np.arange(part[1], part[3]) + 0.5
+            covered[part[1] - y0:part[3] - y0, part[0] - x0:part[2] - x0] += sdf_hole_blur(
+                w - xs if flip_x else xs, h - ys if flip_y else ys, radius, sigma)
+        result.append((x0, y0, sdf_mask(np.clip(1 - covered, 0, 1))))
+    return result
+
+BACKENDS = ('pillow', 'numpy')
+
+def premultiply(pixels):
+    """Float32 premultiplied copy of uint8 RGBA pixels"""
+    out = pixels.astype(np.float32)
+    out[..., :3] *= out[..., 3:] / 255
+    return out
+
+def unpremultiply(pixels):
+    """Rounded uint8 straight-alpha copy of float32 premultiplied RGBA pixels"""
+    alpha = pixels[..., 3]
+    translucent = (alpha > 0) & (alpha < 255)
+    pixels[translucent, :3] *= 255 / alpha[translucent, None]
+    pixels[alpha == 0] = 0
+    pixels += 0.5
+    return pixels.astype(np.uint8)
+
+def composite_numpy(size, layers):
+    """Composite (box, colour, image or array, mask) layers on a uint8 RGBA canvas.
+
+    Each layer replaces the canvas under its mask, as Image.paste does.
+    Unmasked layers and fully covered mask pixels are plain copies; only the
+    partially covered pixels, a thin band along anti-aliased edges, are
+    blended, on premultiplied values. render_image() hands the rounded
+    image over as its solid cross plus the corner tiles, so no full-size
+    mask is built. With aliased masks (antialias=1) the result is identical
+    to the Pillow path. Partially covered corner pixels differ: Pillow
+    pastes a copy already cut by the mask through the mask again and blends
+    unpremultiplied colour, which darkens and thins anti-aliased edges.
+    """
+    canvas = np.zeros((size[1], size[0], 4), np.uint8)
+    for box, layer, layer_mask in layers:
+        # Like Image.paste, drop whatever part of the layer falls off the canvas
+        clipped = intersect_box(box, (0, 0) + tuple(size))
+        if clipped is None:
+            continue
+        x0, y0, x1, y1 = clipped
+        crop = (slice(y0 - box[1], y1 - box[1]), slice(x0 - box[0], x1 - box[0]))
+        region = canvas[y0:y1, x0:x1]
+        solid = isinstance(layer, tuple)
+        pixels = np.array(layer, np.uint8) if solid else np.asarray(layer)[crop]
+        if layer_mask is None:
+            region[...] = pixels
+            continue
+        coverage = np.asarray(layer_mask)[crop]
+        full = coverage == 255
+        partial = (coverage > 0) & ~full
+        region[full] = pixels if solid else pixels[full]
+        if partial.any():
+            below = premultiply(region[partial])
+            above = premultiply(pixels if solid else pixels[partial])
+            below += (above - below) * (coverage[partial, None] / np.float32(255))
+            region[partial] = unpremultiply(below)
+    return Image.fromarray(canvas, 'RGBA')
+
+def clear_corners(img, tiles):
+    """Scale alpha by the rounded mask and clear pixels outside it, touching only the corner tiles"""
+    for x, y, mask in tiles:
+        box = (x, y, x + mask.width, y + mask.height)
+        corner = img.crop(box)
+        corner.putalpha(ImageChops.multiply(corner.getchannel('A'), mask))
+        corner.paste((0, 0, 0, 0), None, mask.point(OUTSIDE_LUT))
+        img.paste(corner, box)
+
+def params_hash(kwargs):
+    """Short hash of the output-affecting options of an apply_effects call"""
+    return hashlib.sha256(canonical_params(kwargs).encode('utf-8')).hexdigest()[:16]
+
+def output_marker(kwargs):
+    """PNG text chunk recording the tool version and options an output was made with"""
+    info = PngInfo()
+    info.add_text(MARKER_KEY, f"{TOOL_VERSION} {params_hash(kwargs)}")
+    return info
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def parse_marker(text):
+    """Split a marker chunk's text into (version, params hash)"""
+    version, _, params = text.partition(' ')
+    return version, params
+
+def read_marker(path):
+    """Return (version, params hash) from an output's marker chunk, or None.
+
+    Only the chunk headers before the first IDAT are read; pixel data is
+    never touched, so this costs one small read per file. Non-PNG and
+    unmarked files return None. ``path`` may also be a seekable binary
+    file object, such as a streamed job's input, which is read from its
+    current position and then rewound there for decoding.
+    """
+    if hasattr(path, 'read'):
+        start = path.tell()
+        try:
+            return scan_marker(path)
+        finally:
+            path.seek(start)
+    with open(path, 'rb') as f:
+        return scan_marker(f)
+
+def scan_marker(f):
+    """Walk a PNG's chunk headers up to the first IDAT looking for the marker chunk"""
+    if f.read(8) != PNG_SIGNATURE:
+        return None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        length, kind = struct.unpack('>I4s', header)
+        if kind in (b'IDAT', b'IEND'):
+            return None
+        if kind == b'tEXt':
+            keyword, _, text = f.read(length).partition(b'\0')
+            if keyword == MARKER_KEY.encode('latin-1'):
+                return parse_marker(text.decode('latin-1'))
+            f.seek(4, os.SEEK_CUR)
+        else:
+            f.seek(length + 4, os.SEEK_CUR)
+
+# Formats whose frame count Pillow only learns by reading through every frame
+SCANNED_FRAME_FORMATS = ('GIF', 'TIFF')
+
+def probe_image(path, count_frames=False):
+    """Describe an image from its header alone, without decoding any pixels.
+
+    Reports format, mode, size, frame count, whether it can hold
+    transparency, the RGBA working-buffer size apply_effects would allocate,
+    and the output marker if the file is already rounded (``None`` otherwise).
+    The frame count of a SCANNED_FRAME_FORMATS file is ``None`` unless
+    ``count_frames`` pays for reading the whole file.
+    """
+    with Image.open(path) as img:
+        marker = img.info.get(MARKER_KEY) if img.format == 'PNG' else None
+        frames = None
+        if count_frames or img.format not in SCANNED_FRAME_FORMATS:
+            frames = getattr(img, 'n_frames', 1)
+        return {
+            'format': img.format,
+            'mode': img.mode,
+            'width': img.width,
+            'height': img.height,
+            'frames': frames,
+            'transparency': may_have_alpha(img),
+            'rgba_bytes': img.width * img.height * 4,
+            'rounded': dict(zip(('version', 'params'), parse_marker(marker))) if marker else None,
+        }
+
+def apply_effects(input_path, output_path, radius_value, unit,
+                  shadow_enabled=False, shadow_color="#000000", shadow_blur=10, shadow_offset=5,
+                  border_enabled=False, border_color="#cccccc", border_width=2, border_style="solid",
+                  antialias=1, shadow_quality="exact", verify_bbox=False, backend="pillow", renderer="stamp"):
+    marker = output_marker(locals())
+    image = render_effects(input_path, radius_value, unit, shadow_enabled, shadow_color, shadow_blur,
+                           shadow_offset, border_enabled, border_color, border_width, border_style,
+                           antialias, shadow_quality, verify_bbox, backend, renderer)
+    # Save as PNG
+    image.save(output_path, 'PNG', pnginfo=marker)
+    return True
+
+def render_effects(input_path, *args, **kwargs):
+    """Round and decorate an image, returning the finished RGBA image instead of saving it"""
+    img, has_alpha = load_image(input_path)
+    return render_image(img, has_alpha, *args, **kwargs)
+
+class StageCache:
+    """The last result of each render stage, keyed by that stage's own inputs.
+
+    A preview session passes one to render_image() so that an update only
+    recomputes the stages whose inputs changed; ``rebuilt`` lists the stages
+    computed since it was last reset.
+    """
+
+    def __init__(self):
+        self.rebuilt = []
+        self._entries = {}
+
+    def get(self, name, key, build):
+        """Return stage ``name``'s value for ``key``, calling build() if the key changed"""
+        entry = self._entries.get(name)
+        if entry is None or entry[0] != key:
+            entry = self._entries[name] = (key, build())
+            self.rebuilt.append(name)
+        return entry[1]
+
+    def clear(self):
+        """Drop every stage, e.g. when the image they were computed from changes"""
+        self._entries.clear()
+
+def render_image(img, has_alpha, radius_value, unit,
+                 shadow_enabled=False, shadow_color="#000000", shadow_blur=10, shadow_offset=5,
+                 border_enabled=False, border_color="#cccccc", border_width=2, border_style="solid",
+                 antialias=1, shadow_quality="exact", verify_bbox=False, backend="pillow", renderer="stamp",
+                 stages=None):
+    """Render the effects onto a decoded RGBA image.
+
+    Without ``stages`` the image may be modified in place. With a StageCache
+    it is left untouched and the per-pixel stages (rounded source, shadow
+    falloff and its colouring) are reused across calls with the same inputs.
+    """
+    antialias = max(1, int(antialias))
+    if shadow_quality not in SHADOW_QUALITIES:
+        raise ValueError(f"Unknown shadow quality: {shadow_quality}")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown renderer: {renderer}")
+    keep_source = stages is not None
+    stages = stages or StageCache()
+    w, h = img.size
+
+    # Calculate radius
+    radius_px = calculate_radius(w, h, radius_value, unit)
+    corners = (int(radius_px), antialias, renderer)
+
+    if not shadow_enabled and not border_enabled:
+        # Fast path: only the four corner tiles change, so round the decoded
+        # image in place instead of building a full mask, copy and canvas
+        def round_corners():
+            rounded = img.copy() if keep_source else img
+            clear_corners(rounded, corner_tiles((w, h), *corners))
+            return rounded
+        img = stages.get('corners', corners, round_corners)
+
+        # An opaque source keeps pixels on every edge, so only a source with
+        # its own transparency can have margins for the auto-crop to trim
+        if has_alpha:
+            bbox = img.getbbox()
+            if bbox and bbox != (0, 0, w, h):
+                img = img.crop(bbox)
+        return img
+
+    # Lay everything out relative to the image's top-left corner, then
+    # allocate the canvas at exactly the union of what gets drawn. The shadow
+    # is the w x h blurred mask moved by the offset (the blur clamps at its
+    # edges instead of spreading), so it only widens the sides it moves towards.
+    boxes = [(0, 0, w, h)]
     if shadow_enabled:
-        # Create shadow
-        shadow = Image.new('RGBA', (w, h), hex_to_rgb(shadow_color) + (255,))
-        shadow.putalpha(mask)
+        boxes.append((shadow_offset, shadow_offset, shadow_offset + w, shadow_offset + h))
+    draw_border = border_enabled and border_width > 0
+    if draw_border:
+        if border_style == "solid":
+            ring, strips = ring_tiles((w, h), int(radius_px), border_width, antialias, renderer)
+            boxes.append((-border_width, -border_width, w + border_width, h + border_width))
+        else:
+            ring, strips = pattern_tiles((w, h), int(radius_px), border_width, border_style, antialias, renderer), []
+            # A gap can fall on the ring's outermost pixels, so the
+            # pattern's extent comes from the (small, cached) pieces
+            for x, y, piece in ring:
+                inked = piece.getbbox()
+                if inked:
+                    boxes.append((x + inked[0] - border_width, y + inked[1] - border_width,
+                                  x + inked[2] - border_width, y + inked[3] - border_width))
+    left, top, right, bottom = union_box(boxes)
+    canvas_size = (right - left, bottom - top)
+
+    # Position of original image on canvas
+    img_x = -left
+    img_y = -top
+
+    # Create mask for rounded corners from the cached corner stamps
+    tiles = corner_tiles((w, h), *corners)
 
-        # Apply blur to shadow
-        shadow = shadow.filter(ImageFilter.GaussianBlur(shadow_blur))
+    # Everything drawn is collected as (box, colour or image, mask) layers
+    # in paint order, each replacing what lies under its mask
+    layers = []
 
+    # Apply shadow if enabled
+    if shadow_enabled:
         # Position shadow on canvas (accounting for border padding)
         shadow_x = img_x + shadow_offset
         shadow_y = img_y + shadow_offset
-        canvas.paste(shadow, (shadow_x, shadow_y), shadow)
+        shadow_box = (shadow_x, shadow_y, shadow_x + w, shadow_y + h)
 
-    # First, paste the rounded image
-    canvas.paste(rounded_img, (img_x, img_y), mask)
+        # The image replaces whatever lies under its mask, so the shadow is only
+        # painted outside the image rectangle and under its rounded corners
+        visible = subtract_box(shadow_box, (img_x, img_y, img_x + w, img_y + h))
+        visible += [intersect_box(shadow_box, (img_x + x, img_y + y, img_x + x + tile.width, img_y + y + tile.height))
+                    for x, y, tile in tiles]
+        visible = [box for box in visible if box]
+        solid = hex_to_rgb(shadow_color) + (255,)
+        layers += [(box, solid, None) for box in visible]
 
-    # Apply border AFTER rounding if enabled (so it appears outside the rounded corners)
-    if border_enabled:
-        # Create border on the full canvas size
-        border_canvas = Image.new('RGBA', (canvas_w, canvas_h), (0, 0, 0, 0))
-        border_draw = ImageDraw.Draw(border_canvas)
+        # Only the alpha varies, and only near the corners: blur those tiles
+        # (or, with the SDF renderer, evaluate their falloff) and colour them.
+        # The closed-form falloffs (the analytic tier and the SDF renderer)
+        # evaluate only the visible part, which moves with the offset, so
+        # the offset joins their stage key.
+        seen = [(x0 - shadow_x, y0 - shadow_y, x1 - shadow_x, y1 - shadow_y) for x0, y0, x1, y1 in visible]
+        def blur_corners():
+            if renderer == "sdf" and np is not None:
+                return sdf_shadow_tiles((w, h), int(radius_px), shadow_blur, seen)
+            return shadow_tiles((w, h), tiles, shadow_blur, shadow_quality, seen)
+        falloff_key = corners + (shadow_blur, shadow_quality)
+        if shadow_quality == "analytic" or renderer == "sdf":
+            falloff_key += (shadow_offset,)
+        falloff = stages.get('shadow_falloff', falloff_key, blur_corners)
+        falloff = stages.get('shadow_color', falloff_key + (shadow_color,),
+                             lambda: [(x, y, colorize_shadow(alpha, shadow_color)) for x, y, alpha in falloff])
+        for x, y, layer in falloff:
+            layers.append(((shadow_x + x, shadow_y + y, shadow_x + x + layer.width, shadow_y + y + layer.height),
+                           layer, None))
 
-        # Calculate border position (outside the rounded image area)
+    # First, paste the rounded image. Pillow pastes a copy already cut by the
+    # mask; NumPy copies the solid cross between the corner tiles and blends
+    # the image into the canvas through each tile, with no full-size mask.
+    if backend == "numpy" and np is not None:
+        pixels = np.asarray(img)
+        cross = [(0, 0, w, h)]
+        for x, y, tile in tiles:
+            cross = [part for box in cross for part in subtract_box(box, (x, y, x + tile.width, y + tile.height))]
+        pieces = [(box, None) for box in cross] + [((x, y, x + tile.width, y + tile.height), tile)
+                                                   for x, y, tile in tiles]
+        for (x0, y0, x1, y1), tile in pieces:
+            layers.append(((img_x + x0, img_y + y0, img_x + x1, img_y + y1), pixels[y0:y1, x0:x1], tile))
+    else:
+        mask = stages.get('mask', corners, lambda: mask_region(tiles, (0, 0, w, h)))
+        def cut_source():
+            source = Image.new('RGBA', (w, h), (0, 0, 0, 0))
+            source.paste(img, (0, 0), mask)
+            return source
+        source = stages.get('source', corners, cut_source)
+        layers.append(((img_x, img_y, img_x + w, img_y + h), source, mask))
+
+    # Apply border AFTER rounding if enabled (so it appears outside the rounded corners)
+    if draw_border:
+        # The ring is drawn straight onto the canvas: solid strips along the
+        # edges plus the cached corner stamps (or, for dashed and dotted
+        # styles, the cached pattern pieces), never a full-canvas layer
+        color = hex_to_rgb(border_color) + (255,)
         border_x = img_x - border_width
         border_y = img_y - border_width
-        border_w = w + border_width * 2
-        border_h = h + border_width * 2
+        layers += [((border_x + x0, border_y + y0, border_x + x1, border_y + y1), color, None)
+                   for x0, y0, x1, y1 in strips]
+        layers += [((border_x + x, border_y + y, border_x + x + tile.width, border_y + y + tile.height), color, tile)
+                   for x, y, tile in ring]
 
-        # Draw the outer border shape (larger rounded rectangle)
-        if border_style == "solid":
-            border_draw.rounded_rectangle([border_x, border_y, border_x + border_w, border_y + border_h],
-                                        radius=int(radius_px + border_width), fill=hex_to_rgb(border_color) + (255,))
-        elif border_style == "dashed":
-            # For dashed, we'll draw multiple rounded rectangles with gaps
-            # This is a simplified dashed implementation
-            dash_length = border_width * 3
-            gap_length = border_width * 2
-            for i in range(0, int(border_w + border_h), dash_length + gap_length):
-                # Draw dashes along the perimeter (simplified)
-                if i < border_w:
-                    # Top dash
-                    border_draw.rounded_rectangle([border_x + i, border_y, border_x + min(i + dash_length, border_w), border_y + border_width],
-                                                radius=max(0, int(radius_px + border_width) - i) if i < radius_px + border_width else 0,
-                                                fill=hex_to_rgb(border_color) + (255,))
-                # Add more complex dashed logic for full perimeter if needed
-        else:  # dotted - similar to dashed but smaller
-            dot_length = border_width
-            gap_length = border_width * 2
-            for i in range(0, int(border_w + border_h), dot_length + gap_length):
-                if i < border_w:
-                    border_draw.rounded_rectangle([border_x + i, border_y, border_x + min(i + dot_length, border_w), border_y + border_width],
-                                                radius=max(0, int(radius_px + border_width) - i) if i < radius_px + border_width else 0,
-                                                fill=hex_to_rgb(border_color) + (255,))
-
-        # Create mask for the inner area (where the rounded image is) to cut out from border
-        inner_mask = Image.new('L', (canvas_w, canvas_h), 0)
-        inner_draw = ImageDraw.Draw(inner_mask)
-        inner_draw.rounded_rectangle([img_x, img_y, img_x + w, img_y + h], radius=int(radius_px), fill=255)
-
-        # Apply the inner mask to remove border from inside the rounded image area
-        border_canvas.putalpha(Image.composite(Image.new('L', (canvas_w, canvas_h), 255), Image.new('L', (canvas_w, canvas_h), 0), inner_mask))
-
-        # Composite border onto canvas
-        canvas = Image.alpha_composite(canvas, border_canvas)
+    if backend == "numpy" and np is not None:
+        canvas = composite_numpy(canvas_size, layers)
+    else:
+        canvas = Image.new('RGBA', canvas_size, (0, 0, 0, 0))
+        for box, layer, layer_mask in layers:
+            canvas.paste(layer, box, layer_mask)
 
     # 8. Auto-crop to remove unnecessary transparent whitespace
-    # This ensures the most outer visible pixel is the image edge
-    bbox = canvas.getbbox()
-    if bbox:
-        canvas = canvas.crop(bbox)
-
-    # Save as PNG
-    canvas.save(output_path, 'PNG')
-    return True
+    # This ensures the most outer visible pixel is the image edge. The canvas
+    # already ends at the outermost drawn pixel of an opaque source, so only
+    # a source with its own transparency can leave margins to trim.
+    full = (0, 0, canvas.width, canvas.height)
+    if verify_bbox and not has_alpha and canvas.getbbox() != full:
+        raise ValueError(f"Computed bounds {full} differ from the pixel bounds {canvas.getbbox()}")
+    if has_alpha:
+        bbox = canvas.getbbox()
+        if bbox and bbox != full:
+            canvas = canvas.crop(bbox)
+    return canvas
 
 def round_image(input_path, output_path, radius_value, unit):
     # Legacy function for backward compatibility
     return apply_effects(input_path, output_path, radius_value, unit)
 
+# Job objects (daemon / batch) use apply_effects' parameter names, plus a few
+# shorter aliases and bookkeeping fields that are echoed back untouched
+EFFECT_FIELDS = tuple(inspect.signature(apply_effects).parameters)
+EFFECT_DEFAULTS = {name: parameter.default for name, parameter in inspect.signature(apply_effects).parameters.items()
+                   if parameter.default is not inspect.Parameter.empty}
+REQUIRED_FIELDS = ('input_path', 'output_path', 'radius_value', 'unit')
+JOB_ALIASES = {'input': 'input_path', 'output': 'output_path', 'radius': 'radius_value'}
+JOB_META_FIELDS = ('id', 'op', 'skip_rounded', 'input_bytes', 'output_format')
+
+# 'png' writes an encoded file; 'rgba' writes the raw pixels, see write_frame()
+OUTPUT_FORMATS = ('png', 'rgba')
+
+def job_arguments(job):
+    """Map a JSON job object onto apply_effects keyword arguments"""
+    if not isinstance(job, dict):
+        raise ValueError("Job must be a JSON object")
+    kwargs = {}
+    for key, value in job.items():
+        name = JOB_ALIASES.get(key, key)
+        if name in EFFECT_FIELDS:
+            kwargs[name] = value
+        elif key not in JOB_META_FIELDS:
+            raise ValueError(f"Unknown job field: {key}")
+    missing = [name for name in REQUIRED_FIELDS if name not in kwargs]
+    if missing:
+        raise ValueError(f"Missing job field(s): {', '.join(missing)}")
+    return kwargs
+
+# Options that do not change the output image, left out of cache keys
+UNHASHED_FIELDS = ('input_path', 'output_path', 'verify_bbox')
+
+def canonical_params(kwargs):
+    """Compact JSON of every output-affecting apply_effects option, defaults filled in"""
+    bound = inspect.signature(apply_effects).bind(**kwargs)
+    bound.apply_defaults()
+    params = {}
+    for name, value in bound.arguments.items():
+        if name in UNHASHED_FIELDS:
+            continue
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        params[name] = value
+    return json.dumps(params, sort_keys=True, separators=(',', ':'))
+
+def file_digest(path, digest=None):
+    """Feed a file's bytes into a hashlib digest (sha256 by default) and return it"""
+    digest = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest
+
+# An over-budget cache is trimmed to this fraction of its budget
+CACHE_LOW_WATER = 0.75
+
+class ResultCache:
+    """Persistent on-disk cache of finished outputs, keyed by input content and effect options.
+
+    Entries are plain PNG files named after their key, so several worker
+    processes can share one directory. A hit refreshes the entry's mtime;
+    once the directory grows past ``max_bytes`` the least recently used
+    entries are deleted down to CACHE_LOW_WATER of it, so a full cache is
+    only rescanned after another share of the budget has been written.
+    With ``link`` a hit hardlinks the entry instead of copying it; jobs detach() their output before writing it, so the cache
+    never rewrites its own entries, but other tools editing outputs in place
+    would.
+
+    Copies sent to worker processes only add entries and report their size
+    in the job result; the process that owns the cache keeps the running
+    total and does the evicting (see account()).
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, link=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.link = link
+        self.owner = True
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = None
+
+    def __getstate__(self):
+        return dict(self.__dict__, owner=False, _bytes=None)
+
+    def key(self, kwargs):
+        """Return the cache key of an apply_effects call"""
+        digest = hashlib.sha256(f"{TOOL_VERSION}\0{canonical_params(kwargs)}\0".encode('utf-8'))
+        return file_digest(kwargs['input_path'], digest).hexdigest()
+
+    def path(self, key):
+        """File holding the entry for key"""
+        return os.path.join(self.directory, key[:2], key + '.png')
+
+    def fetch(self, key, output_path):
+        """Put the cached output for key at output_path; return False on a miss.
+
+        The copy or link is made next to the output and moved over it, so a
+        failed fetch never loses the old file, which for an in-place job is
+        the source image.
+        """
+        entry = self.path(key)
+        temp = f"{output_path}.{os.getpid()}.tmp"
+        try:
+            if os.path.lexists(temp):
+                os.remove(temp)
+            os.utime(entry)
+            if self.link:
+                try:
+                    os.link(entry, temp)
+                except FileNotFoundError:
+                    raise
+                except OSError:
+                    shutil.copyfile(entry, temp)
+            else:
+                shutil.copyfile(entry, temp)
+            os.replace(temp, output_path)
+        except FileNotFoundError:
+            # Another process may have evicted the entry in the meantime
+            self.misses += 1
+            return False
+        finally:
+            if os.path.lexists(temp):
+                os.remove(temp)
+        self.hits += 1
+        return True
+
+    def detach(self, output_path):
+        """Give an output that an earlier hit hardlinked to an entry its own copy before it is rewritten"""
+        if not self.link or not isinstance(output_path, str):
+            return
+        try:
+            if os.stat(output_path).st_nlink < 2:
+                return
+        except FileNotFoundError:
+            return
+        temp = f"{output_path}.{os.getpid()}.tmp"
+        shutil.copyfile(output_path, temp)
+        os.replace(temp, output_path)
+
+    def store(self, key, output_path):
+        """Add a freshly written output under key and return its size in bytes"""
+        entry = self.path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        temp = f"{entry}.{os.getpid()}.tmp"
+        shutil.copyfile(output_path, temp)
+        os.replace(temp, entry)
+        size = os.path.getsize(entry)
+        if self.owner:
+            self.account(size)
+        return size
+
+    def usage(self):
+        """Bytes held by the cache directory, scanned once and then kept as a running total"""
+        if self._bytes is None:
+            self._bytes = sum(size for _, _, size in self._entries())
+        return self._bytes
+
+    def account(self, size):
+        """Count an entry stored by this or a worker process, evicting old entries past the budget"""
+        if self._bytes is None:
+            self.usage()
+        else:
+            self._bytes += size
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        """(mtime, path, size) of every entry; rescanned because other processes share the directory"""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith('.png'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def evict(self):
+        """Delete least recently used entries until the cache is back to its low-water mark"""
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes * CACHE_LOW_WATER:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self._bytes = total
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'directory': self.directory, 'max_bytes': self.max_bytes}
+
+def already_rounded(kwargs):
+    """True if the job's input is itself an output made with the same options"""
+    marker = read_marker(kwargs['input_path'])
+    return marker is not None and marker[1] == params_hash(kwargs)
+
+def run_job(job, cache=None, skip_rounded=False):
+    """Run one job and return a JSON-serialisable result; never raises.
+
+    With a ResultCache, an unchanged input with the same options is copied
+    from the cache instead of being processed, and the result says ``cached``.
+    With ``skip_rounded`` (or the job's own ``skip_rounded`` field) an input
+    that already carries the marker of the same options is left alone and
+    reported as ``skipped``, so repeated runs never round an image twice.
+    A job with ``"output_format": "rgba"`` writes a raw frame instead of a
+    PNG (see write_frame()); its result carries the frame header.
+    """
+    started = time.perf_counter()
+    result = {'id': job.get('id')} if isinstance(job, dict) and 'id' in job else {}
+    try:
+        kwargs = job_arguments(job)
+        output_format = job.get('output_format', 'png')
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        if output_format == 'rgba':
+            options = dict(kwargs)
+            target = options.pop('output_path')
+            if cache is not None:
+                cache.detach(target)
+            result.update(ok=True, output=target, **write_frame(render_effects(**options), target))
+        elif job.get('skip_rounded', skip_rounded) and already_rounded(kwargs):
+            target = kwargs['output_path']
+            if hasattr(target, 'write'):
+                # A streamed output still needs an image: the input, unchanged
+                source = kwargs['input_path']
+                if hasattr(source, 'read'):
+                    target.write(source.read())
+                else:
+                    with open(source, 'rb') as f:
+                        shutil.copyfileobj(f, target)
+            result.update(ok=True, skipped=True)
+        else:
+            key = cache.key(kwargs) if cache is not None else None
+            cached = key is not None and cache.fetch(key, kwargs['output_path'])
+            if not cached:
+                if cache is not None:
+                    cache.detach(kwargs['output_path'])
+                apply_effects(**kwargs)
+                if key is not None:
+                    size = cache.store(key, kwargs['output_path'])
+                    if not cache.owner:
+                        result['stored_bytes'] = size
+            result.update(ok=True, output=kwargs['output_path'])
+            if cached:
+                result['cached'] = True
+    except Exception as e:
+        result.update(ok=False, error=str(e))
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+# Preview sessions fit the decoded source into this many pixels per side,
+# and a latency budget never shrinks them below MIN_PREVIEW_SIZE
+PREVIEW_SIZE = 1024
+MIN_PREVIEW_SIZE = 64
+
+# Rough decode and render costs, used to size a preview for a latency
+# budget before anything has been timed. Reading the compressed data costs
+# READ_COST ms per megabyte (a JPEG's entropy decoding runs at full size
+# whatever its draft() scale); every source pixel of other formats then
+# costs FULL_DECODE_COST and every decoded JPEG pixel DRAFT_COST ms per
+# megapixel. RENDER_COST is ms per megapixel without and with a shadow or
+# border; a session replaces it with its own timings.
+READ_COST = {'JPEG': 14, None: 20}
+FULL_DECODE_COST = 10
+DRAFT_COST = 4.5
+RENDER_COST = (2, 20)
+
+# Options a render's cost depends on; a session times each combination
+COST_FIELDS = ('shadow_enabled', 'border_enabled', 'border_style', 'shadow_quality', 'renderer', 'backend')
+
+def render_cost(options):
+    """A-priori render cost of a set of options, in milliseconds per megapixel"""
+    return RENDER_COST[bool(options.get('shadow_enabled') or options.get('border_enabled'))]
+
+def data_size(input_path):
+    """Size in bytes of a path or a seekable file object"""
+    if hasattr(input_path, 'seek'):
+        position = input_path.tell()
+        size = input_path.seek(0, os.SEEK_END)
+        input_path.seek(position)
+        return size
+    return os.path.getsize(input_path)
+
+def budget_side(source_size, image_format, file_size, budget_ms, cost):
+    """Longest preview side whose estimated decode and first render (``cost`` ms per megapixel) fit budget_ms.
+
+    Only a JPEG's decode shrinks with the preview; other formats pay for
+    every source pixel first and leave the render whatever is left. The
+    short side never drops below MIN_PREVIEW_SIZE, so a budget the decode
+    alone exceeds still yields the smallest preview, just late.
+    """
+    source_mp = source_size[0] * source_size[1] / 1e6
+    fixed = file_size / 1e6 * READ_COST.get(image_format, READ_COST[None])
+    if image_format == 'JPEG':
+        per_mp = DRAFT_COST + cost
+    else:
+        fixed, per_mp = fixed + source_mp * FULL_DECODE_COST, cost
+    scale = math.sqrt(max(0, budget_ms - fixed) / per_mp / source_mp)
+    scale = max(scale, MIN_PREVIEW_SIZE / min(source_size))
+    return max(1, int(max(source_size) * min(1, scale)))
+
+def load_preview(input_path, max_size=PREVIEW_SIZE, budget_ms=None, cost=RENDER_COST[1]):
+    """Decode an image scaled to fit max_size; return (RGBA image, has_alpha, source size).
+
+    JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale through draft(),
+    other formats are shrunk by reduce()'s integer box filter first, so only
+    the last, small step is resampled with Lanczos. With ``budget_ms`` the
+    size is also capped by budget_side() from the header alone, so the
+    draft() scale is chosen before any pixel is decoded.
+    """
+    img = Image.open(input_path)
+    source_size = img.size
+    has_alpha = may_have_alpha(img)
+    if budget_ms is not None:
+        fits = budget_side(source_size, img.format, data_size(input_path), budget_ms, cost)
+        max_size = min(max_size or max(source_size), fits)
+    if max_size and max(source_size) > max_size:
+        factor = max_size / max(source_size)
+        target = (max(1, round(source_size[0] * factor)), max(1, round(source_size[1] * factor)))
+        if img.format == 'JPEG':
+            img.draft(None, target)
+        if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            img = img.convert('RGBA')
+        reduce_by = min(img.width // target[0], img.height // target[1])
+        if reduce_by >= 2:
+            img = img.reduce(reduce_by)
+        if img.size != target:
+            img = img.resize(target, Image.LANCZOS)
+    if img.mode == 'RGBA':
+        img.load()
+        return img, has_alpha, source_size
+    return img.convert('RGBA'), has_alpha, source_size
+
+def render_preview(input_path, max_size=PREVIEW_SIZE, budget_ms=None, **options):
+    """Render a low-resolution but pixel-faithful preview of a job's output in one call"""
+    return PreviewSession(input_path, max_size, budget_ms, options).update(options)
+
+# Options given in source pixels, scaled with a downscaled preview
+PIXEL_OPTIONS = ('shadow_blur', 'shadow_offset', 'border_width')
+
+def effect_options(params):
+    """Map job-style rendering options (aliases allowed) onto render_image() names"""
+    options = {}
+    for key, value in params.items():
+        name = JOB_ALIASES.get(key, key)
+        if name not in EFFECT_FIELDS or name in ('input_path', 'output_path'):
+            raise ValueError(f"Unknown preview option: {key}")
+        options[name] = value
+    return options
+
+def preview_options(options, scale):
+    """Fill in defaults and scale the options given in source pixels to a preview's scale"""
+    missing = [name for name in ('radius_value', 'unit') if name not in options]
+    if missing:
+        raise ValueError(f"Missing preview option(s): {', '.join(missing)}")
+    options = dict(EFFECT_DEFAULTS, **options)
+    if scale != 1:
+        if options['unit'] != 'percent':
+            options['radius_value'] = options['radius_value'] * scale
+        options['shadow_blur'] = options['shadow_blur'] * scale
+        options['shadow_offset'] = round(options['shadow_offset'] * scale)
+        if options['border_width'] > 0:
+            options['border_width'] = max(1, round(options['border_width'] * scale))
+    return options
+
+class PreviewSession:
+    """An image opened once for interactive previews.
+
+    The source is decoded a single time and downscaled to fit ``max_size``.
+    Each update() merges changed options into the current ones and renders
+    again, recomputing only the stages whose inputs changed (see StageCache):
+    a new shadow colour recolours the cached falloff, a new border colour
+    leaves the shadow alone and a new radius never re-decodes. Pixel sizes
+    are scaled with the image so the preview matches the full-size output.
+
+    With ``budget_ms`` the source is decoded no larger than budget_side()
+    allows for a first render with ``options`` (any shadow or border if
+    none are given), and each update renders at the largest halving of the
+    decoded image (down to MIN_PREVIEW_SIZE on the short side) whose
+    estimated cost fits the budget. The estimate is this session's own
+    timing of the same kind of render (see COST_FIELDS), or the a-priori
+    RENDER_COST before there is one, so a slider drag keeps up on slow
+    machines and a one-call render_preview() does not depend on history.
+    """
+
+    def __init__(self, input_path, max_size=PREVIEW_SIZE, budget_ms=None, options=None):
+        started = time.perf_counter()
+        cost = render_cost(effect_options(options)) if options is not None else RENDER_COST[1]
+        self.decoded, self.has_alpha, self.source_size = load_preview(input_path, max_size, budget_ms, cost)
+        self.decode_ms = (time.perf_counter() - started) * 1000
+        self.image = self.decoded
+        self.scale = self.image.width / self.source_size[0]
+        self.budget_ms = budget_ms
+        self.options = {}
+        self.stages = StageCache()
+        # Milliseconds per pixel of the first render at a size, per COST_FIELDS combination
+        self.costs = {}
+        self.timed = set()
+
+    def fit_budget(self, options):
+        """Switch to the largest halving of the decoded image whose estimated render fits the budget"""
+        key = tuple(options.get(name, EFFECT_DEFAULTS[name]) for name in COST_FIELDS)
+        per_pixel = self.costs.get(key, render_cost(options) / 1e6)
+        factor = 1
+        while (self.decoded.width * self.decoded.height * per_pixel > self.budget_ms * factor * factor
+               and min(self.decoded.size) >= 2 * factor * MIN_PREVIEW_SIZE):
+            factor *= 2
+        image = self.decoded.reduce(factor) if factor > 1 else self.decoded
+        if image.size != self.image.size:
+            self.image = image
+            self.scale = image.width / self.source_size[0]
+            self.stages.clear()
+            self.timed.clear()
+        return key
+
+    def update(self, params=None, **options):
+        """Merge job-style options (aliases allowed) into the session and return the RGBA preview"""
+        merged = dict(self.options, **effect_options(dict(params or {}, **options)))
+        key = self.fit_budget(merged) if self.budget_ms is not None else None
+        self.stages.rebuilt = []
+        started = time.perf_counter()
+        preview = render_image(self.image, self.has_alpha, stages=self.stages, **preview_options(merged, self.scale))
+        # Only options that rendered become the session's; a rejected value is forgotten
+        self.options = merged
+        if key is not None and key not in self.timed:
+            # The first render of a kind at this size computes its stages, the worst case
+            self.costs[key] = (time.perf_counter() - started) * 1000 / (self.image.width * self.image.height)
+            self.timed.add(key)
+        return preview
+
+PREVIEW_OPS = ('open', 'update', 'close', 'preview', 'sprite')
+
+# Fields of an update request that are not rendering options
+SESSION_FIELDS = ('id', 'op', 'session', 'output', 'output_path', 'output_format',
+                  'input', 'input_path', 'input_bytes', 'max_size', 'budget_ms')
+
+SESSION_IDS = itertools.count(1)
+
+# Fields of a sprite request that are not rendering options
+SPRITE_FIELDS = ('id', 'op', 'inputs', 'max_size', 'columns', 'padding', 'output', 'output_path', 'output_format')
+
+def preview_op(job, sessions, stdin):
+    """Handle a --serve preview op and return (result, payload or None).
+
+    ``open`` decodes an image (a path, or an ``input_bytes`` payload) into a
+    new PreviewSession; ``update`` renders it with changed options and sends
+    a PNG, or with ``"output_format": "rgba"`` a raw frame, to ``output``
+    ('-', the default, returns it as a payload); ``close`` drops it.
+    ``preview`` is open, update and close in a single round trip, and
+    ``sprite`` renders many ``inputs`` onto one sheet with a JSON atlas.
+    """
+    started = time.perf_counter()
+    op = job['op']
+    result = {'id': job.get('id'), 'ok': True}
+    payload = None
+    if op == 'sprite':
+        if not isinstance(job.get('inputs'), list):
+            raise ValueError("sprite needs a list of inputs")
+        sheet, atlas = render_sprite_sheet(job['inputs'], job.get('max_size', SPRITE_SIZE), job.get('columns'),
+                                           job.get('padding', 2),
+                                           **{k: v for k, v in job.items() if k not in SPRITE_FIELDS})
+        payload = image_output(sheet, job, result)
+        result.update(width=sheet.width, height=sheet.height, atlas=atlas)
+    elif op in ('open', 'preview'):
+        # Only the input comes from stream_job(); an output of '-' is image_output()'s to handle
+        streamed, _ = stream_job(job, stdin)
+        source = streamed.get('input_path', streamed.get('input'))
+        if source is None:
+            raise ValueError(f"{op} needs an input or input_bytes")
+        params = {k: v for k, v in job.items() if k not in SESSION_FIELDS} if op == 'preview' else None
+        session = PreviewSession(source, job.get('max_size', PREVIEW_SIZE), job.get('budget_ms'), params)
+        result.update(source_width=session.source_size[0], source_height=session.source_size[1],
+                      decode_ms=round(session.decode_ms, 3))
+        if op == 'open':
+            session_id = next(SESSION_IDS)
+            sessions[session_id] = session
+            result.update(session=session_id, width=session.image.width, height=session.image.height)
+    else:
+        session = sessions.get(job.get('session'))
+        if session is None:
+            raise ValueError(f"Unknown session: {job.get('session')}")
+        result['session'] = job['session']
+        if op == 'close':
+            del sessions[job['session']]
+    if op in ('update', 'preview'):
+        scale = session.scale
+        image = session.update({k: v for k, v in job.items() if k not in SESSION_FIELDS})
+        payload = image_output(image, job, result)
+        result.update(scale=scale, rebuilt=session.stages.rebuilt)
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result, payload
+
+def image_output(image, job, result):
+    """Send a rendered preview where the job asks; return the payload for '-' (the default), else None.
+
+    The image is written as a PNG, or with ``"output_format": "rgba"`` as a
+    raw frame whose header goes into ``result``.
+    """
+    output_format = job.get('output_format', 'png')
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    target = job.get('output', job.get('output_path', '-'))
+    output = io.BytesIO() if target == '-' else target
+    if output_format == 'rgba':
+        result.update(write_frame(image, output))
+    else:
+        image.save(output, 'PNG')
+    result['output'] = target
+    return output.getvalue() if target == '-' else None
+
+# Thumbnails on a sprite sheet fit this many pixels per side
+SPRITE_SIZE = 256
+
+def render_sprite_sheet(sources, max_size=SPRITE_SIZE, columns=None, padding=2, workers=None, **options):
+    """Render previews of many images in one style onto a single sheet; return (sheet, atlas).
+
+    Sources are decoded at preview size on a thread pool (Pillow's decoders
+    release the GIL) and then rendered one by one, so thumbnails with equal
+    radii share their corner stamps through STAMP_CACHE. Sprites fill rows of
+    ``columns`` (default: a square-ish grid) with ``padding`` pixels between
+    them. The atlas has one entry per source, in order: its x, y, width,
+    height and scale on the sheet, or the error that kept it off.
+    """
+    options = effect_options(options)
+    preview_options(options, 1)
+
+    def decode(source):
+        try:
+            return load_preview(source, max_size), None
+        except Exception as e:
+            return None, str(e)
+
+    with ThreadPoolExecutor(min(len(sources), workers or default_workers()) or 1) as pool:
+        decoded = list(pool.map(decode, sources))
+
+    atlas = []
+    placed = []
+    for source, (loaded, error) in zip(sources, decoded):
+        entry = {'source': source}
+        atlas.append(entry)
+        if loaded is not None:
+            img, has_alpha, source_size = loaded
+            scale = img.width / source_size[0]
+            try:
+                placed.append((entry, render_image(img, has_alpha, **preview_options(options, scale))))
+                entry.update(ok=True, scale=scale)
+                continue
+            except Exception as e:
+                error = str(e)
+        entry.update(ok=False, error=error)
+
+    columns = columns or max(1, math.ceil(math.sqrt(len(placed))))
+    x = y = row_height = sheet_width = 0
+    for index, (entry, sprite) in enumerate(placed):
+        if index and index % columns == 0:
+            x, y, row_height = 0, y + row_height + padding, 0
+        entry.update(x=x, y=y, width=sprite.width, height=sprite.height)
+        sheet_width = max(sheet_width, x + sprite.width)
+        x += sprite.width + padding
+        row_height = max(row_height, sprite.height)
+
+    sheet = Image.new('RGBA', (max(1, sheet_width), max(1, y + row_height)), (0, 0, 0, 0))
+    for entry, sprite in placed:
+        sheet.paste(sprite, (entry['x'], entry['y']))
+    return sheet, atlas
+
+def write_frame(image, target):
+    """Write an image's raw RGBA pixels and return the frame header (width, height, stride).
+
+    Rows are tightly packed, top to bottom, with straight (not premultiplied)
+    alpha, which is what a canvas ImageData expects. ``target`` is a writable
+    buffer or the path of a file that is sized to the frame and written
+    through a memory map, so a RAM-backed file (e.g. under /dev/shm) hands
+    the pixels over without pushing them through a pipe.
+    """
+    pixels = image.tobytes()
+    if isinstance(target, str):
+        fd = os.open(target, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != len(pixels):
+                os.ftruncate(fd, len(pixels))
+            if pixels:
+                with mmap.mmap(fd, len(pixels)) as view:
+                    view[:] = pixels
+        finally:
+            os.close(fd)
+    else:
+        target.write(pixels)
+    return {'width': image.width, 'height': image.height, 'stride': image.width * 4, 'mode': 'RGBA'}
+
+def write_message(stream, message):
+    """Write one JSON line and flush so the reader sees it immediately"""
+    stream.write(json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n')
+    stream.flush()
+
+def read_exact(stream, size):
+    """Read exactly ``size`` bytes, or raise EOFError if the stream ends first"""
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            raise EOFError("Stream ended inside a binary payload")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def stream_job(job, stdin):
+    """Swap a job's '-' input/output for in-memory buffers; return (job, output buffer or None).
+
+    A job with ``"input_bytes": N`` is followed on stdin by N bytes of encoded
+    image; a job with ``"output": "-"`` gets its PNG back after the result line.
+    """
+    output = None
+    if not isinstance(job, dict):
+        return job, output
+    job = dict(job)
+    if 'input_bytes' in job:
+        size = job['input_bytes']
+        if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+            raise ValueError("input_bytes must be a non-negative integer")
+        # Consume the payload before any other check so the stream stays in step
+        payload = read_exact(stdin, size)
+        for name in ('input', 'input_path'):
+            if job.pop(name, '-') != '-':
+                raise ValueError("A job with input_bytes takes its input from the payload")
+        job['input_path'] = io.BytesIO(payload)
+    for name in ('output', 'output_path'):
+        if job.get(name) == '-':
+            output = job[name] = io.BytesIO()
+    return job, output
+
+def write_payload(stream, message, payload):
+    """Write a result line announcing ``output_bytes``, followed by the raw payload"""
+    message['output_bytes'] = len(payload)
+    stream.write(json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n' + payload)
+    stream.flush()
+
+def serve(stdin=None, stdout=None, cache=None):
+    """Run as a persistent worker: one JSON job per input line, one JSON result per output line.
+
+    The worker announces itself with a ``ready`` line, then answers every job
+    in order until stdin closes or a ``{"op": "shutdown"}`` request arrives.
+    Image bytes can travel inline instead of through files (see stream_job()),
+    previews can come back as raw RGBA frames (see write_frame()) and
+    interactive previews keep their image open between updates (see preview_op()).
+    Streamed jobs bypass the result cache, which is keyed by input files.
+    """
+    stdin = stdin or sys.stdin.buffer
+    stdout = stdout or sys.stdout.buffer
+    sessions = {}
+    write_message(stdout, {'ready': True, 'pid': os.getpid()})
+    while True:
+        line = stdin.readline()
+        if not line:
+            break
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            write_message(stdout, {'ok': False, 'error': f"Invalid JSON: {e}"})
+            continue
+        op = job.get('op') if isinstance(job, dict) else None
+        if op == 'shutdown':
+            write_message(stdout, {'id': job.get('id'), 'ok': True})
+            break
+        if op == 'ping':
+            write_message(stdout, {'id': job.get('id'), 'ok': True})
+        elif op == 'stats':
+            stats = {'id': job.get('id'), 'ok': True, 'stamp_cache': STAMP_CACHE.stats(), 'sessions': len(sessions)}
+            if cache is not None:
+                stats['result_cache'] = cache.stats()
+            write_message(stdout, stats)
+        elif op in PREVIEW_OPS:
+            try:
+                result, payload = preview_op(job, sessions, stdin)
+            except EOFError as e:
+                write_message(stdout, {'id': job.get('id'), 'ok': False, 'error': str(e)})
+                break
+            except Exception as e:
+                write_message(stdout, {'id': job.get('id'), 'ok': False, 'error': str(e)})
+                continue
+            if payload is None:
+                write_message(stdout, result)
+            else:
+                write_payload(stdout, result, payload)
+        elif op in (None, 'process'):
+            try:
+                job, output = stream_job(job, stdin)
+            except EOFError as e:
+                # A truncated payload leaves nothing more to read
+                write_message(stdout, {'id': job.get('id'), 'ok': False, 'error': str(e)})
+                break
+            except ValueError as e:
+                write_message(stdout, {'id': job.get('id'), 'ok': False, 'error': str(e)})
+                continue
+            streamed = output is not None or 'input_bytes' in job
+            result = run_job(job, None if streamed else cache)
+            if output is not None and result['ok']:
+                result['output'] = '-'
+                write_payload(stdout, result, output.getvalue())
+            else:
+                write_message(stdout, result)
+        else:
+            write_message(stdout, {'id': job.get('id'), 'ok': False, 'error': f"Unknown op: {op}"})
+
+def read_manifest(stream):
+    """Yield (line_number, job, error) for every non-blank line of a JSONL manifest"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith(b'#'):
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+
+def default_workers():
+    """Number of worker processes to use when none is requested: the usable core count"""
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+def run_parallel(entries, workers=None, max_pending=None, cache=None, skip_rounded=False):
+    """Run (key, job) pairs across worker processes, yielding (key, result) as jobs complete.
+
+    At most ``max_pending`` jobs are in flight, so arbitrarily long job streams
+    are consumed lazily. If a worker process dies (e.g. a decoder crash), the
+    pool is replaced and the jobs that were in flight are retried once; a job
+    that is in flight for a second crash is reported as failed. Entries the
+    workers add to a result cache are counted and evicted here, in the
+    process that owns the cache.
+    """
+    workers = workers or default_workers()
+    max_pending = max_pending or workers * 4
+    entries = iter(entries)
+    pending = {}
+    attempts = {}
+    retry = []
+    if cache is not None:
+        cache.usage()
+
+    def finished(result):
+        if cache is not None and 'stored_bytes' in result:
+            cache.account(result.pop('stored_bytes'))
+        return result
+
+    executor = ProcessPoolExecutor(workers)
+    try:
+        while True:
+            while len(pending) < max_pending:
+                if retry:
+                    key, job = retry.pop()
+                else:
+                    try:
+                        key, job = next(entries)
+                    except StopIteration:
+                        break
+                pending[executor.submit(run_job, job, cache, skip_rounded)] = (key, job)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            crashed = []
+            for future in done:
+                key, job = pending.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    crashed.append((key, job))
+                else:
+                    yield key, finished(result)
+            if crashed:
+                # Everything still in flight on the broken pool fails with it
+                for future, (key, job) in pending.items():
+                    if future.done() and future.exception() is None:
+                        yield key, finished(future.result())
+                    else:
+                        crashed.append((key, job))
+                pending.clear()
+                executor.shutdown(wait=False)
+                executor = ProcessPoolExecutor(workers)
+                for key, job in crashed:
+                    attempts[key] = attempts.get(key, 0) + 1
+                    if attempts[key] > 1:
+                        job_id = job.get('id') if isinstance(job, dict) else None
+                        yield key, {'id': job_id, 'ok': False, 'error': "Worker process died while running this job"}
+                    else:
+                        retry.append((key, job))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def run_batch(manifest, report, workers=1, cache=None, skip_rounded=False):
+    """Run every job of a manifest stream, writing one report line per job.
+
+    With ``workers`` > 1 jobs are spread over a process pool and reported in
+    completion order; each record carries its manifest ``line`` either way.
+    Returns a summary dict with ok/failed/cached/skipped counts and total wall time.
+    """
+    started = time.perf_counter()
+    summary = {'ok': 0, 'failed': 0, 'cached': 0, 'skipped': 0}
+
+    def record(line_number, result):
+        result['line'] = line_number
+        summary['ok' if result['ok'] else 'failed'] += 1
+        summary['cached'] += bool(result.get('cached'))
+        summary['skipped'] += bool(result.get('skipped'))
+        write_message(report, result)
+
+    if workers == 1:
+        for line_number, job, error in read_manifest(manifest):
+            record(line_number, run_job(job, cache, skip_rounded) if error is None else {'ok': False, 'error': error})
+    else:
+        def jobs():
+            for line_number, job, error in read_manifest(manifest):
+                if error is None:
+                    yield line_number, job
+                else:
+                    record(line_number, {'ok': False, 'error': error})
+
+        for line_number, result in run_parallel(jobs(), workers, cache=cache, skip_rounded=skip_rounded):
+            record(line_number, result)
+    summary['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return summary
+
+def open_stream(path, mode):
+    """Open a binary file stream, treating '-' as stdin/stdout"""
+    if path == '-':
+        return sys.stdin.buffer if 'r' in mode else sys.stdout.buffer
+    return open(path, mode)
+
+def add_cache_arguments(parser):
+    """Add the shared --cache options of --serve, --batch and --sync"""
+    parser.add_argument('--cache', metavar='DIR', help="Reuse finished outputs from this result cache directory")
+    parser.add_argument('--cache-size', type=int, default=512, metavar='MB',
+                        help="Result cache budget in MiB (default: 512)")
+    parser.add_argument('--cache-link', action='store_true',
+                        help="Hardlink cached outputs instead of copying them")
+
+def result_cache(args):
+    """Build the ResultCache requested on the command line, if any"""
+    if not args.cache:
+        return None
+    return ResultCache(args.cache, args.cache_size * 1024 * 1024, args.cache_link)
+
+def serve_main(argv):
+    """Entry point for --serve"""
+    parser = argparse.ArgumentParser(prog='round_image.py --serve')
+    add_cache_arguments(parser)
+    serve(cache=result_cache(parser.parse_args(argv)))
+
+def batch_main(argv):
+    """Entry point for --batch: process a whole manifest in one interpreter"""
+    parser = argparse.ArgumentParser(prog='round_image.py --batch')
+    parser.add_argument('manifest', help="JSONL file with one job per line, or '-' for stdin")
+    parser.add_argument('--report', default='-', help="JSONL report destination (default: stdout)")
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help="Worker processes (default: number of cores; 1 runs in-process)")
+    parser.add_argument('--skip-rounded', action='store_true',
+                        help="Leave inputs alone that are already rounded with the same options")
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    manifest = open_stream(args.manifest, 'rb')
+    report = open_stream(args.report, 'wb')
+    try:
+        summary = run_batch(manifest, report, args.workers, result_cache(args), args.skip_rounded)
+    finally:
+        if manifest is not sys.stdin.buffer:
+            manifest.close()
+        if report is not sys.stdout.buffer:
+            report.close()
+    print(f"Processed {summary['ok'] + summary['failed']} job(s): {summary['ok']} ok "
+          f"({summary['cached']} from cache, {summary['skipped']} already rounded), "
+          f"{summary['failed']} failed in {summary['elapsed_ms'] / 1000:.2f}s", file=sys.stderr)
+    return 0 if summary['failed'] == 0 else 1
+
+# Image types the plugin offers to round (SUPPORTED_EXTENSIONS in main.ts)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    params_hash TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    output_hash TEXT NOT NULL,
+    processed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS links (
+    note TEXT NOT NULL,
+    link TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS links_by_note ON links (note);
+"""
+
+def open_index(db_path):
+    """Open (creating if needed) the SQLite index of processed images and note references"""
+    db = sqlite3.connect(db_path)
+    db.executescript(INDEX_SCHEMA)
+    return db
+
+def vault_entries(root, folder=''):
+    """Yield (vault path, DirEntry) for every file below a vault root, skipping dot folders.
+
+    Vault paths use '/' like Obsidian's own. os.scandir hands back the entry
+    type without a stat call, so the walk itself costs one readdir per folder.
+    """
+    with os.scandir(os.path.join(root, folder)) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        path = f"{folder}/{entry.name}" if folder else entry.name
+        if entry.is_dir(follow_symlinks=False):
+            if not entry.name.startswith('.'):
+                yield from vault_entries(root, path)
+        elif entry.is_file():
+            yield path, entry
+
+def is_source_image(path):
+    """Whether a vault file is an image the plugin would round (not an earlier output)"""
+    return path.lower().endswith(IMAGE_EXTENSIONS) and '-rounded-' not in posixpath.basename(path)
+
+def vault_images(root):
+    """Yield vault paths of source images, skipping dot folders and earlier outputs"""
+    for path, _ in vault_entries(root):
+        if is_source_image(path):
+            yield path
+
+# The reference syntaxes main.ts's extractImageReferences() recognises
+MARKDOWN_IMAGE = re.compile(r'!\[([^\]]*)\]\((?:<([^>]+)>|([^)\s]+))(?:\s+"([^"]*)")?\)')
+WIKILINK_IMAGE = re.compile(r'!\[\[([^|\]]+)(?:\|([^\]]+))?\]\]')
+HTML_IMAGE = re.compile(r'<img[^>]+src=["\']([^"\']+)["\'][^>]*>', re.IGNORECASE)
+
+def extract_image_references(text):
+    """Return the link targets of every markdown, wikilink and <img> embed in a note"""
+    links = [(match.group(2) or match.group(3)).strip() for match in MARKDOWN_IMAGE.finditer(text)]
+    links += [match.group(1).strip() for match in WIKILINK_IMAGE.finditer(text)]
+    links += [match.group(1).strip() for match in HTML_IMAGE.finditer(text)]
+    return links
+
+def resolve_reference(link, note, images, by_name):
+    """Resolve a link from a note to a vault image path, or None.
+
+    Tries the path relative to the note, then from the vault root, then the
+    bare file name anywhere in the vault (Obsidian's shortest-path links).
+    URLs and links to anything that is not a known image resolve to None.
+    """
+    if re.match(r'[a-z][a-z0-9+.-]*:', link, re.IGNORECASE):
+        return None
+    link = unquote(link.split('#')[0].split('?')[0]).strip()
+    if link.startswith('./'):
+        link = link[2:]
+    if not link:
+        return None
+    for candidate in (posixpath.join(posixpath.dirname(note), link), link.lstrip('/')):
+        candidate = posixpath.normpath(candidate)
+        if candidate in images:
+            return candidate
+    return by_name.get(posixpath.basename(link).lower())
+
+def index_references(root, db):
+    """Bring the note table up to date and return (image -> referencing notes, stats).
+
+    Only notes whose size or mtime changed since the last run are read and
+    parsed; the raw links of the others come from the database. Links are
+    resolved against the images present now, so adding or moving an image
+    never requires re-reading the notes that mention it.
+    """
+    notes = {}
+    images = set()
+    for path, entry in vault_entries(root):
+        lower = path.lower()
+        if lower.endswith('.md'):
+            stat = entry.stat()
+            notes[path] = (stat.st_size, stat.st_mtime_ns)
+        elif lower.endswith(IMAGE_EXTENSIONS):
+            images.add(path)
+
+    known = {row[0]: tuple(row[1:]) for row in db.execute("SELECT path, size, mtime_ns FROM notes")}
+    parsed = 0
+    for path, stat in notes.items():
+        if known.get(path) == stat:
+            continue
+        with open(os.path.join(root, path), encoding='utf-8', errors='replace') as f:
+            links = dict.fromkeys(extract_image_references(f.read()))
+        db.execute("DELETE FROM links WHERE note = ?", (path,))
+        db.executemany("INSERT INTO links VALUES (?, ?)", [(path, link) for link in links])
+        db.execute("INSERT OR REPLACE INTO notes VALUES (?, ?, ?)", (path,) + stat)
+        parsed += 1
+    removed = set(known) - set(notes)
+    for path in removed:
+        db.execute("DELETE FROM links WHERE note = ?", (path,))
+        db.execute("DELETE FROM notes WHERE path = ?", (path,))
+    db.commit()
+
+    by_name = {}
+    for path in sorted(images, key=lambda path: (path.count('/'), path)):
+        by_name.setdefault(posixpath.basename(path).lower(), path)
+    index = {}
+    for note, link in db.execute("SELECT note, link FROM links ORDER BY note"):
+        image = resolve_reference(link, note, images, by_name)
+        if image is not None and note not in index.setdefault(image, []):
+            index[image].append(note)
+    return index, {'notes': len(notes), 'parsed': parsed, 'removed': len(removed)}
+
+def rounded_name(path, style):
+    """Output path the plugin's dual image system uses: <base>-rounded-<radius>p(x).png"""
+    radius = style['radius_value']
+    if isinstance(radius, float) and radius.is_integer():
+        radius = int(radius)
+    suffix = f"{radius}p" if style['unit'] == 'percent' else f"{radius}px"
+    return f"{os.path.splitext(path)[0]}-rounded-{suffix}.png"
+
+def run_sync(root, style, db_path, in_place=False, workers=1, cache=None, report=None, referenced=False):
+    """Round every image under a vault root that is new or changed since the last run.
+
+    Each processed image is recorded with its size, mtime, content hash,
+    options hash and output hash. On the next run an image whose size and
+    mtime are unchanged is skipped without being read; one whose stat
+    changed is hashed, and only reprocessed if its content or the options
+    differ. Rows of images that no longer exist are dropped. With
+    ``referenced`` only images embedded in at least one note are considered.
+    """
+    started = time.perf_counter()
+    style = job_arguments(dict(style, input_path='', output_path=''))
+    style_hash = params_hash(style)
+    summary = {'ok': 0, 'failed': 0, 'unchanged': 0, 'removed': 0}
+    db = open_index(db_path)
+    try:
+        rows = {row[0]: row[1:] for row in db.execute(
+            "SELECT path, size, mtime_ns, content_hash, params_hash, output_path FROM images")}
+        pending = []
+        seen = set()
+        if referenced:
+            sources = sorted(path for path in index_references(root, db)[0] if is_source_image(path))
+        else:
+            sources = vault_images(root)
+        for path in sources:
+            seen.add(path)
+            source = os.path.join(root, path)
+            stat = os.stat(source)
+            row = rows.get(path)
+            output = path if in_place else rounded_name(path, style)
+            if row and row[3] == style_hash and row[4] == output and os.path.exists(os.path.join(root, output)):
+                if (row[0], row[1]) == (stat.st_size, stat.st_mtime_ns):
+                    summary['unchanged'] += 1
+                    continue
+                content_hash = file_digest(source).hexdigest()
+                if content_hash == row[2]:
+                    # Touched but identical: remember the new stat so it is not hashed again
+                    db.execute("UPDATE images SET size = ?, mtime_ns = ? WHERE path = ?",
+                               (stat.st_size, stat.st_mtime_ns, path))
+                    summary['unchanged'] += 1
+                    continue
+            job = dict(style, input_path=source, output_path=os.path.join(root, output), skip_rounded=in_place)
+            pending.append((path, job))
+
+        def record(path, result):
+            if report is not None:
+                write_message(report, dict(result, path=path))
+            if not result['ok']:
+                summary['failed'] += 1
+                return
+            summary['ok'] += 1
+            source = os.path.join(root, path)
+            output = path if in_place else rounded_name(path, style)
+            stat = os.stat(source)
+            content_hash = file_digest(source).hexdigest()
+            output_hash = content_hash if in_place else file_digest(os.path.join(root, output)).hexdigest()
+            db.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (path, stat.st_size, stat.st_mtime_ns, content_hash, style_hash,
+                        output, output_hash, time.time()))
+            db.commit()
+
+        if workers == 1:
+            for path, job in pending:
+                record(path, run_job(job, cache))
+        else:
+            for path, result in run_parallel(pending, workers, cache=cache):
+                record(path, result)
+
+        for path in set(rows) - seen:
+            if not os.path.exists(os.path.join(root, path)):
+                db.execute("DELETE FROM images WHERE path = ?", (path,))
+                summary['removed'] += 1
+        db.commit()
+    finally:
+        db.close()
+    summary['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return summary
+
+def default_db(root):
+    """State database used when --db is not given"""
+    return os.path.join(root, '.image-rounded-frame.sqlite')
+
+def load_style(value):
+    """Parse a --style argument: inline JSON or the path of a JSON file"""
+    if value.lstrip().startswith('{'):
+        return json.loads(value)
+    with open(value, 'rb') as f:
+        return json.load(f)
+
+def sync_main(argv):
+    """Entry point for --sync: incrementally round a whole vault"""
+    parser = argparse.ArgumentParser(prog='round_image.py --sync')
+    parser.add_argument('vault', help="Vault root folder")
+    parser.add_argument('--style', required=True,
+                        help="Job options as inline JSON or a JSON file, e.g. '{\"radius\": 10, \"unit\": \"percent\"}'")
+    parser.add_argument('--db', help="State database (default: <vault>/.image-rounded-frame.sqlite)")
+    parser.add_argument('--in-place', action='store_true',
+                        help="Overwrite the images instead of writing <name>-rounded-<radius>.png next to them")
+    parser.add_argument('--referenced', action='store_true',
+                        help="Only round images that are embedded in at least one note")
+    parser.add_argument('--report', help="JSONL report of the processed images ('-' for stdout)")
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help="Worker processes (default: number of cores; 1 runs in-process)")
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    try:
+        style = load_style(args.style)
+        if not isinstance(style, dict):
+            raise ValueError("Style must be a JSON object")
+    except (OSError, ValueError) as e:
+        parser.error(f"Invalid --style: {e}")
+
+    report = open_stream(args.report, 'wb') if args.report else None
+    try:
+        summary = run_sync(args.vault, style, args.db or default_db(args.vault), args.in_place,
+                           args.workers, result_cache(args), report, args.referenced)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if report is not None and report is not sys.stdout.buffer:
+            report.close()
+    print(f"Synced {args.vault}: {summary['ok']} processed, {summary['unchanged']} unchanged, "
+          f"{summary['failed']} failed, {summary['removed']} removed in {summary['elapsed_ms'] / 1000:.2f}s",
+          file=sys.stderr)
+    return 0 if summary['failed'] == 0 else 1
+
+def probe_main(argv):
+    """Entry point for --probe: one JSON line of header facts per image"""
+    parser = argparse.ArgumentParser(prog='round_image.py --probe')
+    parser.add_argument('paths', nargs='*', default=['-'],
+                        help="Images to probe; '-' (the default) reads one path per line from stdin")
+    parser.add_argument('--frames', action='store_true',
+                        help="Count the frames of GIF and TIFF files too, which reads each file through")
+    args = parser.parse_args(argv)
+
+    def paths():
+        for path in args.paths:
+            if path == '-':
+                for line in sys.stdin:
+                    if line.strip():
+                        yield line.rstrip('\r\n')
+            else:
+                yield path
+
+    failed = 0
+    for path in paths():
+        try:
+            result = dict({'path': path, 'ok': True}, **probe_image(path, args.frames))
+        except Exception as e:
+            result = {'path': path, 'ok': False, 'error': str(e)}
+            failed += 1
+        write_message(sys.stdout.buffer, result)
+    return 0 if failed == 0 else 1
+
+def index_main(argv):
+    """Entry point for --index: print which notes embed each image"""
+    parser = argparse.ArgumentParser(prog='round_image.py --index')
+    parser.add_argument('vault', help="Vault root folder")
+    parser.add_argument('--db', help="State database (default: <vault>/.image-rounded-frame.sqlite)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    db = open_index(args.db or default_db(args.vault))
+    try:
+        index, stats = index_references(args.vault, db)
+    finally:
+        db.close()
+    for image in sorted(index):
+        write_message(sys.stdout.buffer, {'image': image, 'notes': index[image]})
+    print(f"Indexed {stats['notes']} note(s) ({stats['parsed']} parsed, {stats['removed']} removed): "
+          f"{len(index)} referenced image(s) in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    return 0
+
+def run_cli(render, input_arg, output_arg, *args):
+    """Run a positional-argument CLI job; '-' reads the image from stdin / writes the PNG to stdout.
+
+    Output for stdout is encoded in memory and written only once complete, so
+    a failed run never leaves half a PNG on the pipe. Since stdout then
+    carries the image, no SUCCESS line is printed.
+    """
+    input_path = io.BytesIO(sys.stdin.buffer.read()) if input_arg == '-' else input_arg
+    output_path = io.BytesIO() if output_arg == '-' else output_arg
+    try:
+        render(input_path, output_path, *args)
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    if output_arg == '-':
+        sys.stdout.buffer.write(output_path.getvalue())
+        sys.stdout.buffer.flush()
+    else:
+        print("SUCCESS")
+    return 0
+
 if __name__ == '__main__':
     # Support both old and new argument formats for backward compatibility
-    if len(sys.argv) == 5:
+    if sys.argv[1:2] == ['--serve']:
+        # Persistent worker mode, see serve()
+        serve_main(sys.argv[2:])
+    elif sys.argv[1:2] == ['--batch']:
+        # Manifest mode, see batch_main()
+        sys.exit(batch_main(sys.argv[2:]))
+    elif sys.argv[1:2] == ['--sync']:
+        # Incremental vault mode, see sync_main()
+        sys.exit(sync_main(sys.argv[2:]))
+    elif sys.argv[1:2] == ['--probe']:
+        # Header-only image facts, see probe_main()
+        sys.exit(probe_main(sys.argv[2:]))
+    elif sys.argv[1:2] == ['--index']:
+        # Note -> image reference index, see index_main()
+        sys.exit(index_main(sys.argv[2:]))
+    elif len(sys.argv) == 5:
         # Legacy format: input_path, output_path, radius_value, unit
         input_path = sys.argv[1]
         output_path = sys.argv[2]
         radius_value = float(sys.argv[3])
         unit = sys.argv[4]
 
-        try:
-            round_image(input_path, output_path, radius_value, unit)
-            print("SUCCESS")
-        except Exception as e:
-            print(f"ERROR: {e}", file=sys.stderr)
-            sys.exit(1)
+        sys.exit(run_cli(round_image, input_path, output_path, radius_value, unit))
     elif len(sys.argv) >= 13:
         # New format with effects: input_path, output_path, radius_value, unit,
         # shadow_enabled, shadow_color, shadow_blur, shadow_offset,
@@ -168,14 +2352,9 @@ if __name__ == '__main__':
         border_width = int(sys.argv[11])
         border_style = sys.argv[12]
 
-        try:
-            apply_effects(input_path, output_path, radius_value, unit,
+        sys.exit(run_cli(apply_effects, input_path, output_path, radius_value, unit,
                          shadow_enabled, shadow_color, shadow_blur, shadow_offset,
-                         border_enabled, border_color, border_width, border_style)
-            print("SUCCESS")
-        except Exception as e:
-            print(f"ERROR: {e}", file=sys.stderr)
-            sys.exit(1)
+                         border_enabled, border_color, border_width, border_style))
     else:
         print("ERROR: Invalid number of arguments", file=sys.stderr)
         sys.exit(1)
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Test script for manifest batch mode (round_image.py --batch).
+Runs good and bad jobs through one invocation and checks the JSONL report.
+"""
+
+from PIL import Image, ImageDraw
+import subprocess
+import tempfile
+import json
+import pickle
+import os
+import sys
+
+import round_image
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'round_image.py')
+
+def create_test_image(path, size=(120, 90)):
+    """Create a simple test image"""
+    img = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(img)
+    draw.ellipse([20, 10, 100, 80], fill='green')
+    img.save(path)
+
+def write_manifest(tmp, count=5):
+    """Write a manifest with `count` valid jobs, one corrupt input and one malformed line"""
+    lines = []
+    for i in range(count):
+        source = os.path.join(tmp, f'in{i}.png')
+        create_test_image(source)
+        lines.append(json.dumps({'id': f'job{i}', 'input': source, 'output': os.path.join(tmp, f'out{i}.png'),
+                                 'radius': 10 + i, 'unit': 'percent', 'border_enabled': i % 2 == 0}))
+    corrupt = os.path.join(tmp, 'corrupt.png')
+    with open(corrupt, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\nnot really a png')
+    lines.append(json.dumps({'id': 'corrupt', 'input': corrupt, 'output': os.path.join(tmp, 'corrupt-out.png'),
+                             'radius': 5, 'unit': 'px'}))
+    lines.append('{not json')
+    manifest = os.path.join(tmp, 'manifest.jsonl')
+    with open(manifest, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return manifest
+
+def run_batch_cli(*args, stdin=None):
+    """Run round_image.py --batch and return (returncode, report records)"""
+    result = subprocess.run([sys.executable, SCRIPT, '--batch', *args],
+                            input=stdin, capture_output=True)
+    return result.returncode, [json.loads(line) for line in result.stdout.splitlines()]
+
+def test_batch_report():
+    """Every manifest line gets a report record; failures do not stop the batch"""
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = write_manifest(tmp)
+        returncode, records = run_batch_cli(manifest)
+        assert returncode == 1
+        assert len(records) == 7
+        by_id = {r.get('id'): r for r in records}
+        for i in range(5):
+            assert by_id[f'job{i}']['ok'] and by_id[f'job{i}']['elapsed_ms'] >= 0
+            assert os.path.exists(os.path.join(tmp, f'out{i}.png'))
+        assert not by_id['corrupt']['ok']
+        assert not by_id[None]['ok'] and by_id[None]['line'] == 7
+
+def test_batch_from_stdin():
+    """A manifest can be streamed on stdin"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source)
+        job = {'input': source, 'output': os.path.join(tmp, 'out.png'), 'radius': 8, 'unit': 'px'}
+        returncode, records = run_batch_cli('-', stdin=(json.dumps(job) + '\n').encode('utf-8'))
+        assert returncode == 0
+        assert [r['ok'] for r in records] == [True]
+
+def test_batch_workers_match_in_process():
+    """The process pool produces the same outputs as the in-process runner"""
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = write_manifest(tmp, count=8)
+        _, serial = run_batch_cli(manifest, '--workers', '1')
+        serial_pixels = [Image.open(os.path.join(tmp, f'out{i}.png')).tobytes() for i in range(8)]
+        _, parallel = run_batch_cli(manifest, '--workers', '3')
+        parallel_pixels = [Image.open(os.path.join(tmp, f'out{i}.png')).tobytes() for i in range(8)]
+        assert sorted(r['line'] for r in serial) == sorted(r['line'] for r in parallel)
+        assert {r['line']: r['ok'] for r in serial} == {r['line']: r['ok'] for r in parallel}
+        assert serial_pixels == parallel_pixels
+
+def test_batch_result_cache():
+    """A second run over unchanged inputs is served from the result cache"""
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = write_manifest(tmp)
+        cache = os.path.join(tmp, 'cache')
+        _, first = run_batch_cli(manifest, '--workers', '2', '--cache', cache)
+        pixels = [Image.open(os.path.join(tmp, f'out{i}.png')).tobytes() for i in range(5)]
+        for i in range(5):
+            os.remove(os.path.join(tmp, f'out{i}.png'))
+        _, second = run_batch_cli(manifest, '--cache', cache)
+        assert not any(r.get('cached') for r in first)
+        assert sorted(r['line'] for r in second if r.get('cached')) == [1, 2, 3, 4, 5]
+        assert pixels == [Image.open(os.path.join(tmp, f'out{i}.png')).tobytes() for i in range(5)]
+
+def test_result_cache_keys_and_eviction():
+    """Keys follow input bytes and options; the oldest entries go once the budget is exceeded"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source)
+        cache = round_image.ResultCache(os.path.join(tmp, 'cache'), max_bytes=1)
+        job = {'input_path': source, 'output_path': os.path.join(tmp, 'out.png'), 'radius_value': 10, 'unit': 'px'}
+        assert cache.key(job) == cache.key(dict(job, radius_value=10.0, shadow_enabled=False, verify_bbox=True))
+        assert cache.key(job) != cache.key(dict(job, radius_value=11))
+
+        assert round_image.run_job(job, cache)['ok'] and cache.stats()['misses'] == 1
+        assert cache.stats()['evictions'] == 1 and not round_image.run_job(job, cache).get('cached')
+        cache.max_bytes = 1 << 20
+        assert round_image.run_job(job, cache)['ok']
+        assert round_image.run_job(job, cache)['cached'] and cache.stats()['hits'] == 1
+
+def test_linked_outputs_never_rewrite_cache_entries():
+    """A miss that writes to an output hardlinked by an earlier hit leaves the cache entry intact"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source)
+        output = os.path.join(tmp, 'out.png')
+        cache = round_image.ResultCache(os.path.join(tmp, 'cache'), link=True)
+        small = {'input': source, 'output': output, 'radius': 10, 'unit': 'px'}
+        large = dict(small, radius=40)
+        assert not round_image.run_job(small, cache).get('cached')
+        assert round_image.run_job(small, cache)['cached'] and os.stat(output).st_nlink == 2
+        assert not round_image.run_job(large, cache).get('cached')
+        assert round_image.run_job(small, cache)['cached']
+        marker = round_image.read_marker(output)[1]
+        assert marker == round_image.params_hash(round_image.job_arguments(small))
+
+def test_failed_fetch_keeps_in_place_source():
+    """An entry evicted mid-fetch is a miss; the output, here the source itself, is never removed first"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source)
+        cache = round_image.ResultCache(os.path.join(tmp, 'cache'))
+        job = {'input': source, 'output': os.path.join(tmp, 'out.png'), 'radius': 10, 'unit': 'px'}
+        assert round_image.run_job(job, cache)['ok']
+
+        utime = round_image.os.utime
+        def evicted(path):
+            utime(path)
+            os.remove(path)
+        round_image.os.utime = evicted
+        try:
+            result = round_image.run_job(dict(job, output=source), cache)
+        finally:
+            round_image.os.utime = utime
+        assert result['ok'] and not result.get('cached') and cache.stats()['misses'] == 2
+        assert Image.open(source).size == (120, 90)
+        assert sorted(os.listdir(tmp)) == ['cache', 'in.png', 'out.png']
+
+def test_workers_leave_cache_accounting_to_the_parent():
+    """Worker copies of the cache never rescan it; the parent scans once and evicts to the budget"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source)
+        cache = round_image.ResultCache(os.path.join(tmp, 'cache'))
+        copy = pickle.loads(pickle.dumps(cache))
+        copy._entries = None
+        job = {'input': source, 'output': os.path.join(tmp, 'copy.png'), 'radius': 3, 'unit': 'px'}
+        result = round_image.run_job(job, copy)
+        assert result['ok'] and result['stored_bytes'] == os.path.getsize(job['output'])
+
+        scans = []
+        entries = round_image.ResultCache._entries
+        round_image.ResultCache._entries = lambda self: scans.append(1) or entries(self)
+        try:
+            jobs = [(i, dict(job, output=os.path.join(tmp, f'out{i}.png'), radius=4 + i)) for i in range(8)]
+            results = dict(round_image.run_parallel(jobs, 2, cache=cache))
+            assert all(r['ok'] and 'stored_bytes' not in r for r in results.values()) and len(scans) == 1
+            cache.max_bytes = 3 * os.path.getsize(job['output'])
+            jobs = [(i, dict(job, output=os.path.join(tmp, f'out{i}.png'), radius=20 + i)) for i in range(6)]
+            list(round_image.run_parallel(jobs, 2, cache=cache))
+        finally:
+            round_image.ResultCache._entries = entries
+        assert cache.evictions > 0 and sum(size for _, _, size in cache._entries()) <= cache.max_bytes
+
+def test_full_cache_rescans_once_per_quarter_budget():
+    """At capacity, eviction trims to the low-water mark instead of rescanning on every store"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source)
+        cache = round_image.ResultCache(os.path.join(tmp, 'cache'))
+        job = {'input': source, 'output': os.path.join(tmp, 'out.png'), 'radius': 1, 'unit': 'px'}
+        for radius in range(1, 21):
+            assert round_image.run_job(dict(job, radius=radius), cache)['ok']
+        cache.max_bytes = cache.usage()
+
+        scans = []
+        entries = round_image.ResultCache._entries
+        round_image.ResultCache._entries = lambda self: scans.append(1) or entries(self)
+        try:
+            for radius in range(21, 61):
+                assert round_image.run_job(dict(job, radius=radius), cache)['ok']
+        finally:
+            round_image.ResultCache._entries = entries
+        assert cache.evictions >= 40 and len(scans) <= 10
+        assert sum(size for _, _, size in cache._entries()) <= cache.max_bytes
+
+def test_skip_already_rounded():
+    """Outputs carry a marker of their options; in-place re-runs with the same options leave them alone"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'photo.png')
+        create_test_image(source)
+        assert round_image.read_marker(source) is None
+        job = {'input': source, 'output': source, 'radius': 10, 'unit': 'percent', 'border_enabled': True}
+        assert not round_image.run_job(job, skip_rounded=True).get('skipped')
+        version, params = round_image.read_marker(source)
+        assert version == round_image.TOOL_VERSION and params == round_image.params_hash(round_image.job_arguments(job))
+        with open(source, 'rb') as f:
+            rounded = f.read()
+
+        assert round_image.run_job(job, skip_rounded=True)['skipped']
+        assert round_image.run_job(dict(job, skip_rounded=True))['skipped']
+        with open(source, 'rb') as f:
+            assert f.read() == rounded
+        assert not round_image.run_job(dict(job, radius=12), skip_rounded=True).get('skipped')
+
+def test_sync_processes_only_new_and_changed():
+    """A vault sync rounds new images once, rehashes touched ones and redoes only changed ones"""
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = os.path.join(tmp, 'vault')
+        os.makedirs(os.path.join(vault, 'notes', 'img'))
+        os.makedirs(os.path.join(vault, '.obsidian'))
+        for path in ('a.png', 'notes/img/b.png', '.obsidian/icon.png'):
+            create_test_image(os.path.join(vault, path))
+        db = os.path.join(tmp, 'index.sqlite')
+        style = {'radius': 10, 'unit': 'percent'}
+
+        first = round_image.run_sync(vault, style, db)
+        assert (first['ok'], first['unchanged']) == (2, 0)
+        assert os.path.exists(os.path.join(vault, 'notes', 'img', 'b-rounded-10p.png'))
+        assert not os.path.exists(os.path.join(vault, '.obsidian', 'icon-rounded-10p.png'))
+
+        os.utime(os.path.join(vault, 'a.png'))
+        create_test_image(os.path.join(vault, 'notes', 'img', 'b.png'), size=(100, 90))
+        create_test_image(os.path.join(vault, 'c.jpg'))
+        second = round_image.run_sync(vault, style, db)
+        assert (second['ok'], second['unchanged']) == (2, 1)
+        assert Image.open(os.path.join(vault, 'notes', 'img', 'b-rounded-10p.png')).size == (100, 90)
+
+        os.remove(os.path.join(vault, 'c.jpg'))
+        third = round_image.run_sync(vault, dict(style, radius=12), db)
+        assert (third['ok'], third['unchanged'], third['removed']) == (2, 0, 1)
+        assert round_image.run_sync(vault, dict(style, radius=12), db)['unchanged'] == 2
+
+def test_probe_reports_header_facts():
+    """--probe describes plain, transparent, already rounded and animated images without decoding them"""
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, 'plain.jpg')
+        Image.new('RGB', (300, 200), 'navy').save(plain)
+        rounded = os.path.join(tmp, 'rounded.png')
+        job = {'input': plain, 'output': rounded, 'radius': 10, 'unit': 'px'}
+        round_image.run_job(job)
+        missing = os.path.join(tmp, 'missing.png')
+        result = subprocess.run([sys.executable, SCRIPT, '--probe', plain, '-'],
+                                input=f"{rounded}\n{missing}\n".encode('utf-8'), capture_output=True)
+        records = [json.loads(line) for line in result.stdout.splitlines()]
+        assert result.returncode == 1 and [r['path'] for r in records] == [plain, rounded, missing]
+        assert records[0] == {'path': plain, 'ok': True, 'format': 'JPEG', 'mode': 'RGB', 'width': 300,
+                              'height': 200, 'frames': 1, 'transparency': False, 'rgba_bytes': 240000,
+                              'rounded': None}
+        assert records[1]['transparency'] and records[1]['rounded'] == {
+            'version': round_image.TOOL_VERSION, 'params': round_image.params_hash(round_image.job_arguments(job))}
+        assert not records[2]['ok'] and records[2]['error']
+
+        # A GIF's frame count needs a read through the file, so it is only reported on request
+        animation = os.path.join(tmp, 'animation.gif')
+        frames = [Image.new('RGB', (40, 30), (shade, 0, 0)) for shade in range(0, 250, 50)]
+        frames[0].save(animation, save_all=True, append_images=frames[1:])
+        assert round_image.probe_image(animation)['frames'] is None
+        result = subprocess.run([sys.executable, SCRIPT, '--probe', '--frames', animation], capture_output=True)
+        assert json.loads(result.stdout)['frames'] == 5
+
+if __name__ == '__main__':
+    test_batch_report()
+    test_batch_from_stdin()
+    test_batch_workers_match_in_process()
+    test_batch_result_cache()
+    test_result_cache_keys_and_eviction()
+    test_linked_outputs_never_rewrite_cache_entries()
+    test_failed_fetch_keeps_in_place_source()
+    test_full_cache_rescans_once_per_quarter_budget()
+    test_workers_leave_cache_accounting_to_the_parent()
+    test_skip_already_rounded()
+    test_sync_processes_only_new_and_changed()
+    test_probe_reports_header_facts()
+    print("Batch test completed.")
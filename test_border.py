@@ -4,10 +4,13 @@ Test script for the new border functionality.
 Creates a test image and applies different border effects.
 """
 
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageChops
 import subprocess
+import tempfile
 import os
 
+import round_image
+
 def create_test_image():
     """Create a simple test image"""
     # Create a 200x200 image with colored squares
@@ -76,6 +79,100 @@ def test_border_effects():
         except Exception as e:
             print(f"  ✗ Exception in {test_case['name']}: {e}")
 
+def reference_ring(size, radius, width, antialias=1):
+    """Full-size ring: outer rounded rectangle minus the image's rounded mask"""
+    w, h = size
+    outer = round_image.rounded_mask((w + 2 * width, h + 2 * width), radius + width, antialias)
+    cut = Image.new('L', outer.size, 0)
+    cut.paste(round_image.rounded_mask(size, radius, antialias), (width, width))
+    return ImageChops.multiply(outer, ImageChops.invert(cut))
+
+def test_ring_tiles_match_full_ring():
+    """Strips plus corner stamps cover exactly the full-size ring"""
+    for size in [(200, 120), (64, 64), (33, 34), (17, 19)]:
+        for radius in [0, 3, 10, 16, 31]:
+            radius = min(radius, min(size) // 2)
+            for width in [1, 2, 5]:
+                for antialias in [1, 3]:
+                    expected = reference_ring(size, radius, width, antialias)
+                    tiles, strips = round_image.ring_tiles(size, radius, width, antialias)
+                    actual = Image.new('L', expected.size, 0)
+                    for box in strips:
+                        actual.paste(255, box)
+                    for x, y, tile in tiles:
+                        actual.paste(tile, (x, y))
+                    assert ImageChops.difference(actual, expected).getbbox() is None, (size, radius, width, antialias)
+
+def test_border_surrounds_image():
+    """A solid border frames the image instead of covering it"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        Image.new('RGB', (200, 120), (10, 200, 30)).save(source)
+        output = os.path.join(tmp, 'out.png')
+        round_image.apply_effects(source, output, 20, 'percent', border_enabled=True,
+                                  border_color='#ff0000', border_width=3)
+        result = Image.open(output)
+        assert result.size == (206, 126)
+        assert result.getpixel((103, 63)) == (10, 200, 30, 255)
+        assert result.getpixel((1, 63)) == (255, 0, 0, 255)
+        assert result.getpixel((103, 125)) == (255, 0, 0, 255)
+        assert result.getpixel((0, 0))[3] == 0
+
+def test_pattern_runs_around_whole_ring():
+    """Dashed and dotted borders stay inside the ring and reach every side and corner"""
+    size, radius, width = (200, 120), 20, 6
+    ring = reference_ring(size, radius, width)
+    for style in ('dashed', 'dotted'):
+        pattern = Image.new('L', ring.size, 0)
+        for x, y, piece in round_image.pattern_tiles(size, radius, width, style):
+            pattern.paste(piece, (x, y))
+        assert ImageChops.subtract(pattern, ring).getbbox() is None
+        assert 0 < pattern.histogram()[255] < ring.histogram()[255]
+        w, h = ring.size
+        for box in [(0, 0, w, width), (0, h - width, w, h), (0, 0, width, h), (w - width, 0, w, h),
+                    (0, 0, radius, radius), (w - radius, h - radius, w, h)]:
+            assert pattern.crop(box).getbbox() is not None, (style, box)
+
+def test_computed_bounds_match_pixels():
+    """The geometric auto-crop box agrees with a pixel scan of the canvas"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [(120, 80), (21, 21)]:
+            source = os.path.join(tmp, 'in.png')
+            Image.new('RGB', size, 'navy').save(source)
+            for style in ('solid', 'dashed', 'dotted'):
+                for shadow in (False, True):
+                    round_image.apply_effects(source, os.path.join(tmp, 'out.png'), 50, 'percent',
+                                              shadow_enabled=shadow, shadow_offset=4, border_enabled=True,
+                                              border_width=3, border_style=style, verify_bbox=True)
+
+def test_numpy_backend_matches_pillow():
+    """The NumPy compositing backend gives the same pixels for aliased masks, tiny images and pills included"""
+    if round_image.np is None:
+        print("  NumPy not installed, skipping backend test")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image().convert('RGBA').save(source)
+        tiny = os.path.join(tmp, 'tiny.png')
+        Image.new('RGB', (40, 25), 'orange').save(tiny)
+        cases = [(source, 12, 'solid', True, 4), (source, 12, 'dashed', True, 4), (source, 12, 'dotted', False, 4),
+                 (source, 50, 'dotted', True, 6), (tiny, 50, 'dotted', False, 5), (tiny, 50, 'dashed', True, 3),
+                 (tiny, 20, 'dotted', True, 2), (tiny, 0, 'dashed', False, 5)]
+        for path, radius, style, shadow, width in cases:
+            outputs = []
+            for backend in round_image.BACKENDS:
+                output = os.path.join(tmp, f'{backend}.png')
+                round_image.apply_effects(path, output, radius, 'percent', shadow_enabled=shadow,
+                                          shadow_color='#3366cc', border_enabled=True, border_width=width,
+                                          border_style=style, backend=backend)
+                outputs.append(Image.open(output).convert('RGBa'))
+            assert ImageChops.difference(*outputs).getbbox() is None, (path, radius, style, shadow, width)
+
 if __name__ == '__main__':
     test_border_effects()
+    test_ring_tiles_match_full_ring()
+    test_border_surrounds_image()
+    test_pattern_runs_around_whole_ring()
+    test_computed_bounds_match_pixels()
+    test_numpy_backend_matches_pillow()
     print("\nTest completed. Check the generated PNG files to verify border positioning.")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script for corner-only rounding.
+Checks that rounding the corner tiles in place matches the full-size mask.
+"""
+
+from PIL import Image, ImageChops
+import tempfile
+import os
+
+import round_image
+
+SIZES = [(200, 120), (64, 64), (61, 200), (33, 34), (17, 19)]
+RADII = [0, 1, 5, 12, 16, 30, 31, 32]
+
+def create_test_image(size):
+    """Create a noisy RGBA test image"""
+    noise = Image.effect_noise(size, 60)
+    img = Image.merge('RGB', [noise, noise.transpose(Image.FLIP_TOP_BOTTOM),
+                              noise.transpose(Image.FLIP_LEFT_RIGHT)])
+    return img.convert('RGBA')
+
+def full_mask_reference(img, radius):
+    """Round corners the original way: full mask, paste onto a transparent copy"""
+    mask = round_image.rounded_mask(img.size, radius)
+    rounded = Image.new('RGBA', img.size, (0, 0, 0, 0))
+    rounded.paste(img, (0, 0), mask)
+    return rounded
+
+def test_corner_tiles_match_full_mask():
+    """clear_corners() with corner_tiles() is bit-identical to the full-mask path"""
+    for size in SIZES:
+        img = create_test_image(size)
+        for radius in RADII:
+            radius = min(radius, min(size) // 2)
+            expected = full_mask_reference(img, radius)
+            actual = img.copy()
+            round_image.clear_corners(actual, round_image.corner_tiles(size, radius))
+            assert actual.tobytes() == expected.tobytes(), (size, radius)
+
+def test_fast_path_crops_transparent_margins():
+    """Without effects, transparent margins of the source are still auto-cropped"""
+    with tempfile.TemporaryDirectory() as tmp:
+        img = Image.new('RGBA', (100, 80), (0, 0, 0, 0))
+        img.paste((255, 0, 0, 255), (10, 5, 90, 70))
+        source = os.path.join(tmp, 'margins.png')
+        img.save(source)
+        output = os.path.join(tmp, 'out.png')
+        round_image.apply_effects(source, output, 10, 'px')
+        assert Image.open(output).size == (80, 65)
+
+def test_stamp_cache_hits_and_budget():
+    """Stamps are built once per key and evicted oldest-first past the byte budget"""
+    cache = round_image.StampCache(max_bytes=4 * 11 * 11 + 4 * 21 * 21)
+    build_count = []
+
+    def builder(radius):
+        def build():
+            build_count.append(radius)
+            return tuple(Image.new('L', (radius + 1, radius + 1)) for _ in range(4))
+        return build
+
+    cache.get((10, 0, 1), builder(10))
+    cache.get((10, 0, 1), builder(10))
+    cache.get((20, 0, 1), builder(20))
+    assert build_count == [10, 20]
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+    cache.get((5, 0, 1), builder(5))
+    assert cache.stats()['evictions'] == 1 and cache.bytes <= cache.max_bytes
+    cache.get((10, 0, 1), builder(10))
+    assert build_count == [10, 20, 5, 10]
+
+def test_antialiased_corners():
+    """Anti-aliased stamps have partial coverage along the arc and keep the same solid interior"""
+    aliased = round_image.corner_stamp(20)
+    smooth = round_image.corner_stamp(20, antialias=4)
+    assert set(aliased[0].tobytes()) <= {0, 255}
+    assert any(0 < v < 255 for v in smooth[0].tobytes())
+    assert smooth[0].getpixel((20, 20)) == 255 and smooth[0].getpixel((0, 0)) == 0
+
+    img = create_test_image((80, 60))
+    round_image.clear_corners(img, round_image.corner_tiles(img.size, 20, antialias=4))
+    alphas = set(img.crop((0, 0, 21, 21)).getchannel('A').tobytes())
+    assert 0 in alphas and 255 in alphas and any(0 < a < 255 for a in alphas)
+
+def test_ring_stamp_excludes_image():
+    """Border ring stamps never overlap the image's own rounded mask"""
+    for radius, width in [(0, 3), (8, 2), (15, 6)]:
+        inner = round_image.corner_stamp(radius)
+        for ring, tile, offset in zip(round_image.ring_stamp(radius, width), inner,
+                                      ((width, width), (0, width), (width, 0), (0, 0))):
+            assert ring.size == (radius + width + 1, radius + width + 1)
+            overlap = ImageChops.multiply(ring.crop((offset[0], offset[1], offset[0] + radius + 1,
+                                                     offset[1] + radius + 1)), tile)
+            assert overlap.getbbox() is None
+
+def test_sdf_corners():
+    """SDF tiles are anti-aliased mirror images, and the SDF ring and mask add up to at most full coverage"""
+    np = round_image.np
+    if np is None:
+        print("  NumPy not installed, skipping SDF test")
+        return
+    top_left, top_right, _, bottom_right = round_image.sdf_stamp(20)[:4]
+    assert top_right.tobytes() == top_left.transpose(Image.FLIP_LEFT_RIGHT).tobytes()
+    assert bottom_right.tobytes() == top_left.rotate(180).tobytes()
+    assert any(0 < v < 255 for v in top_left.tobytes())
+    for size, radius, width in [((120, 80), 20, 4), ((40, 40), 20, 3), ((90, 60), 1, 2)]:
+        mask = round_image.mask_region(round_image.corner_tiles(size, radius, renderer='sdf'), (0, 0) + size)
+        supersampled = round_image.rounded_mask(size, radius, antialias=8)
+        assert np.abs(np.asarray(mask, float) - np.asarray(supersampled, float)).mean() < 2, (size, radius)
+        tiles, strips = round_image.ring_tiles(size, radius, width, renderer='sdf')
+        ring = Image.new('L', (size[0] + 2 * width, size[1] + 2 * width), 0)
+        for box in strips:
+            ring.paste(255, box)
+        for x, y, tile in tiles:
+            ring.paste(tile, (x, y))
+        inner = ring.crop((width, width, width + size[0], width + size[1]))
+        assert (np.asarray(inner, int) + np.asarray(mask, int)).max() <= 256, (size, radius, width)
+
+if __name__ == '__main__':
+    test_corner_tiles_match_full_mask()
+    test_fast_path_crops_transparent_margins()
+    test_stamp_cache_hits_and_budget()
+    test_antialiased_corners()
+    test_ring_stamp_excludes_image()
+    test_sdf_corners()
+    print("Corner test completed.")
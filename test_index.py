@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test script for the vault reference index (round_image.py --index).
+Builds a small vault and checks the image -> notes index and its incremental updates.
+"""
+
+from PIL import Image
+import tempfile
+import os
+
+import round_image
+
+def write(vault, path, text=None):
+    """Write a note, or a small image when no text is given"""
+    full = os.path.join(vault, path)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    if text is None:
+        Image.new('RGB', (40, 30), 'purple').save(full)
+    else:
+        with open(full, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+def test_extract_image_references():
+    """Markdown, wikilink and <img> embeds are all found, grouped by syntax; plain links are not"""
+    text = ('![alt](img/a.png) ![spaced](<img/my photo.jpg> "title") ![[b.png|200]] '
+            '<IMG class="x" src=\'c.gif\'> [not an embed](d.png) ![[Other note]]')
+    assert round_image.extract_image_references(text) == [
+        'img/a.png', 'img/my photo.jpg', 'b.png', 'Other note', 'c.gif']
+
+def test_index_resolves_and_updates_incrementally():
+    """Links resolve relative to the note, from the root or by name; only changed notes are re-read"""
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = os.path.join(tmp, 'vault')
+        for path in ('assets/a.png', 'notes/img/b.png', 'deep/er/c.jpg', '.obsidian/d.png'):
+            write(vault, path)
+        write(vault, 'notes/one.md', '![](img/b.png) ![[c.jpg]] ![](https://example.com/x.png)')
+        write(vault, 'two.md', '![](assets/a.png) <img src="notes/img/b.png"> ![](./missing.png)')
+        write(vault, '.obsidian/skip.md', '![](assets/a.png)')
+        db = round_image.open_index(os.path.join(tmp, 'index.sqlite'))
+        try:
+            index, stats = round_image.index_references(vault, db)
+            assert index == {'notes/img/b.png': ['notes/one.md', 'two.md'],
+                             'deep/er/c.jpg': ['notes/one.md'], 'assets/a.png': ['two.md']}
+            assert stats == {'notes': 2, 'parsed': 2, 'removed': 0}
+
+            write(vault, 'two.md', '![[b.png]]')
+            os.remove(os.path.join(vault, 'notes', 'one.md'))
+            write(vault, 'assets/new/c.jpg')
+            index, stats = round_image.index_references(vault, db)
+            assert index == {'notes/img/b.png': ['two.md']}
+            assert stats == {'notes': 1, 'parsed': 1, 'removed': 1}
+            assert round_image.index_references(vault, db)[1]['parsed'] == 0
+        finally:
+            db.close()
+
+def test_sync_referenced_only():
+    """--sync --referenced rounds only the images some note embeds"""
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = os.path.join(tmp, 'vault')
+        write(vault, 'used.png')
+        write(vault, 'unused.png')
+        write(vault, 'note.md', '![[used.png]]')
+        summary = round_image.run_sync(vault, {'radius': 5, 'unit': 'px'}, os.path.join(tmp, 'index.sqlite'),
+                                       referenced=True)
+        assert summary['ok'] == 1
+        assert os.path.exists(os.path.join(vault, 'used-rounded-5px.png'))
+        assert not os.path.exists(os.path.join(vault, 'unused-rounded-5px.png'))
+
+if __name__ == '__main__':
+    test_extract_image_references()
+    test_index_resolves_and_updates_incrementally()
+    test_sync_referenced_only()
+    print("Index test completed.")
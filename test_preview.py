@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Test script for interactive preview sessions.
+Checks that updates only recompute the stages whose inputs changed and still match a full render.
+"""
+
+from PIL import Image, ImageChops, ImageDraw, JpegImagePlugin
+import subprocess
+import tempfile
+import io
+import json
+import os
+import sys
+
+import round_image
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'round_image.py')
+
+def create_test_image(path, size=(240, 160)):
+    """Create a simple test image"""
+    img = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(img)
+    draw.ellipse([20, 10, size[0] - 20, size[1] - 10], fill='darkgreen')
+    img.save(path)
+
+def test_session_recomputes_only_changed_stages():
+    """Colour changes reuse the blurred shadow, radius changes reuse the decoded image"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source)
+        session = round_image.PreviewSession(source, max_size=None)
+        options = {'radius': 12, 'unit': 'percent', 'shadow_enabled': True, 'shadow_blur': 8,
+                   'border_enabled': True, 'border_color': '#223344'}
+        preview = session.update(options)
+        assert set(session.stages.rebuilt) == {'shadow_falloff', 'shadow_color', 'mask', 'source'}
+        expected = round_image.render_effects(source, 12, 'percent', shadow_enabled=True, shadow_blur=8,
+                                              border_enabled=True, border_color='#223344')
+        assert preview.tobytes() == expected.tobytes()
+
+        session.update(shadow_color='#aa0000')
+        assert session.stages.rebuilt == ['shadow_color']
+        session.update(border_color='#ffffff', border_style='dotted')
+        assert session.stages.rebuilt == []
+        session.update(radius=20)
+        assert 'shadow_falloff' in session.stages.rebuilt and 'source' in session.stages.rebuilt
+        preview = session.update(shadow_enabled=False, border_enabled=False)
+        assert session.stages.rebuilt == ['corners']
+        assert preview.tobytes() == round_image.render_effects(source, 20, 'percent').tobytes()
+
+def test_rejected_update_leaves_session_options():
+    """An update with an invalid value fails alone; the next valid update renders from the last good options"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source)
+        session = round_image.PreviewSession(source, max_size=None)
+        session.update(radius=10, unit='percent', shadow_enabled=True)
+        for bad in ({'shadow_quality': 'bogus'}, {'backend': 'gpu', 'radius': 30}):
+            try:
+                session.update(bad)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"{bad} was accepted")
+        preview = session.update(radius=12)
+        assert session.options == {'radius_value': 12, 'unit': 'percent', 'shadow_enabled': True}
+        assert preview.tobytes() == round_image.render_effects(source, 12, 'percent', shadow_enabled=True).tobytes()
+
+def test_session_scales_pixel_options():
+    """A downscaled session scales px sizes, so it looks like a shrunk full render"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source, (800, 400))
+        session = round_image.PreviewSession(source, max_size=200)
+        preview = session.update(radius=40, unit='px', border_enabled=True, border_width=8)
+        assert session.image.size == (200, 100) and preview.size == (204, 104)
+
+def test_reduced_decode_is_faithful():
+    """JPEG draft and reduce() decode at the preview size and still match a downscaled full render"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ('in.jpg', 'in.png'):
+            source = os.path.join(tmp, name)
+            create_test_image(source, (1600, 1000))
+            img, has_alpha, source_size = round_image.load_preview(source, 400)
+            assert img.mode == 'RGBA' and img.size == (400, 250) and source_size == (1600, 1000) and not has_alpha
+
+            options = {'shadow_enabled': True, 'shadow_blur': 24, 'shadow_offset': 16,
+                       'border_enabled': True, 'border_width': 8}
+            preview = round_image.render_preview(source, 400, radius=80, unit='px', **options)
+            full = round_image.render_effects(source, 80, 'px', **options)
+            assert preview.size == (round(full.width / 4), round(full.height / 4))
+            reference = full.resize(preview.size, Image.LANCZOS)
+            histogram = ImageChops.difference(preview, reference).histogram()
+            mean = sum((index % 256) * count for index, count in enumerate(histogram)) / sum(histogram)
+            assert mean < 2, (name, mean)
+
+def test_budget_lowers_resolution():
+    """A budget picks the largest halving that fits its estimate, never below the minimum, per session"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source, (1024, 512))
+        session = round_image.PreviewSession(source, max_size=512, budget_ms=0)
+        assert session.decoded.size == (128, 64)
+        sizes = [session.update(radius=radius, unit='percent', border_enabled=True).size for radius in (10, 11)]
+        assert sizes == [(130, 66), (130, 66)]
+        assert session.scale == 1 / 8
+
+        session = round_image.PreviewSession(source, max_size=512, budget_ms=1e6)
+        assert session.update(radius=10, unit='percent', border_enabled=True).size == (514, 258)
+        assert session.costs
+        # A tight budget with the session's own timings halves the decoded image
+        session.budget_ms = max(session.costs.values()) * 512 * 256 / 3
+        assert session.update(radius=11).size == (258, 130)
+        assert session.scale == 1 / 4
+
+def test_budget_sizes_one_call_previews():
+    """A one-call preview is decoded at the size its budget allows for its own options"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source, (1024, 512))
+        assert round_image.render_preview(source, 512, radius=10, unit='percent').size == (512, 256)
+        assert round_image.render_preview(source, 512, budget_ms=1e6, radius=10, unit='percent').size == (512, 256)
+        assert round_image.render_preview(source, 512, budget_ms=0, radius=10, unit='percent').size == (128, 64)
+        # A PNG is decoded in full first; what is left covers a plain render but not a shadowed one
+        decode = 1024 * 512 * round_image.FULL_DECODE_COST + os.path.getsize(source) * round_image.READ_COST[None]
+        budget = decode / 1e6 + 1
+        assert round_image.render_preview(source, 512, budget_ms=budget, radius=10, unit='percent').size == (512, 256)
+        shadowed = round_image.PreviewSession(source, 512, budget, {'shadow_enabled': True})
+        assert 128 < shadowed.decoded.width < 512
+
+def test_budget_picks_jpeg_draft_scale():
+    """A JPEG's budget is met by decoding it at a smaller draft scale, not by shrinking it afterwards"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.jpg')
+        create_test_image(source, (2048, 1024))
+        decodes = []
+        draft = JpegImagePlugin.JpegImageFile.draft
+        def spy(image, mode, size):
+            decodes.append(size)
+            return draft(image, mode, size)
+        JpegImagePlugin.JpegImageFile.draft = spy
+        try:
+            big = round_image.PreviewSession(source, max_size=1024)
+            small = round_image.PreviewSession(source, max_size=1024, budget_ms=2)
+        finally:
+            JpegImagePlugin.JpegImageFile.draft = draft
+        assert decodes == [(1024, 512), small.decoded.size]
+        assert min(small.decoded.size) >= round_image.MIN_PREVIEW_SIZE
+        assert small.decoded.width < big.decoded.width
+
+def test_sprite_sheet_matches_single_previews():
+    """Every atlas rectangle holds exactly the preview of its source; unreadable sources are listed, not placed"""
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = []
+        for i, size in enumerate([(300, 200), (120, 240), (640, 480), (90, 90), (500, 150)]):
+            sources.append(os.path.join(tmp, f'in{i}.{"jpg" if i % 2 else "png"}'))
+            create_test_image(sources[-1], size)
+        broken = os.path.join(tmp, 'broken.png')
+        with open(broken, 'wb') as f:
+            f.write(b'not an image')
+        sources.insert(2, broken)
+        options = {'radius': 15, 'unit': 'percent', 'shadow_enabled': True, 'border_enabled': True}
+
+        sheet, atlas = round_image.render_sprite_sheet(sources, 128, columns=3, padding=4, **options)
+        assert [entry['source'] for entry in atlas] == sources
+        assert not atlas[2]['ok'] and atlas[2]['error'] and 'x' not in atlas[2]
+        placed = [entry for entry in atlas if entry['ok']]
+        assert [(entry['x'], entry['y']) for entry in placed][:4] == [(0, 0), (placed[0]['width'] + 4, 0),
+                                                                     (placed[0]['width'] + placed[1]['width'] + 8, 0),
+                                                                     (0, max(e['height'] for e in placed[:3]) + 4)]
+        for entry in placed:
+            sprite = sheet.crop((entry['x'], entry['y'], entry['x'] + entry['width'], entry['y'] + entry['height']))
+            assert sprite.tobytes() == round_image.render_preview(entry['source'], 128, **options).tobytes()
+
+def test_serve_preview_session():
+    """open / update / close drive a session through the worker"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        create_test_image(source)
+        worker = subprocess.Popen([sys.executable, SCRIPT, '--serve'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        def send(message):
+            worker.stdin.write((json.dumps(message) + '\n').encode('utf-8'))
+            worker.stdin.flush()
+            return json.loads(worker.stdout.readline())
+
+        try:
+            assert json.loads(worker.stdout.readline())['ready'] is True
+            opened = send({'id': 1, 'op': 'open', 'input': source, 'max_size': 120})
+            assert opened['ok'] and (opened['width'], opened['height']) == (120, 80)
+            assert (opened['source_width'], opened['source_height']) == (240, 160)
+
+            frame = send({'id': 2, 'op': 'update', 'session': opened['session'], 'output_format': 'rgba',
+                          'radius': 10, 'unit': 'percent', 'shadow_enabled': True})
+            assert frame['ok'] and 'shadow_falloff' in frame['rebuilt']
+            pixels = worker.stdout.read(frame['output_bytes'])
+            assert len(pixels) == frame['stride'] * frame['height']
+
+            recolored = send({'id': 3, 'op': 'update', 'session': opened['session'], 'output_format': 'rgba',
+                              'shadow_color': '#ff0000'})
+            assert recolored['rebuilt'] == ['shadow_color']
+            worker.stdout.read(recolored['output_bytes'])
+
+            png = os.path.join(tmp, 'preview.png')
+            saved = send({'id': 4, 'op': 'update', 'session': opened['session'], 'output': png})
+            assert saved['ok'] and saved['rebuilt'] == [] and Image.open(png).size == (frame['width'], frame['height'])
+
+            one_shot = send({'id': 8, 'op': 'preview', 'input': source, 'max_size': 60, 'output_format': 'rgba',
+                             'radius': 10, 'unit': 'percent'})
+            assert one_shot['ok'] and (one_shot['width'], one_shot['height']) == (60, 40) and one_shot['scale'] == 0.25
+            worker.stdout.read(one_shot['output_bytes'])
+
+            explicit = send({'id': 10, 'op': 'preview', 'input': source, 'max_size': 60, 'output': '-',
+                             'radius': 10, 'unit': 'percent'})
+            assert explicit['ok'] and explicit['output'] == '-'
+            assert Image.open(io.BytesIO(worker.stdout.read(explicit['output_bytes']))).size == (60, 40)
+
+            sprite = send({'id': 9, 'op': 'sprite', 'inputs': [source, source], 'max_size': 48, 'columns': 1,
+                           'padding': 0, 'radius': 10, 'unit': 'percent'})
+            assert sprite['ok'] and [(e['x'], e['y']) for e in sprite['atlas']] == [(0, 0), (0, 32)]
+            assert Image.open(io.BytesIO(worker.stdout.read(sprite['output_bytes']))).size == (48, 64)
+
+            assert send({'id': 5, 'op': 'close', 'session': opened['session']})['ok']
+            assert not send({'id': 6, 'op': 'update', 'session': opened['session']})['ok']
+            assert send({'id': 7, 'op': 'shutdown'})['ok']
+            assert worker.wait(timeout=10) == 0
+        finally:
+            if worker.poll() is None:
+                worker.kill()
+
+if __name__ == '__main__':
+    test_session_recomputes_only_changed_stages()
+    test_rejected_update_leaves_session_options()
+    test_session_scales_pixel_options()
+    test_reduced_decode_is_faithful()
+    test_budget_lowers_resolution()
+    test_budget_sizes_one_call_previews()
+    test_budget_picks_jpeg_draft_scale()
+    test_sprite_sheet_matches_single_previews()
+    test_serve_preview_session()
+    print("Preview test completed.")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Test script for the persistent worker mode (round_image.py --serve).
+Starts one worker and pushes several jobs through it.
+"""
+
+from PIL import Image, ImageDraw
+import subprocess
+import io
+import tempfile
+import json
+import os
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'round_image.py')
+
+def create_test_image(path, size=(160, 120)):
+    """Create a simple test image"""
+    img = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([10, 10, 70, 60], fill='red')
+    draw.rectangle([80, 50, 150, 110], fill='blue')
+    img.save(path)
+
+def send(worker, message):
+    """Send one job line and read the matching result line"""
+    worker.stdin.write((json.dumps(message) + '\n').encode('utf-8'))
+    worker.stdin.flush()
+    return json.loads(worker.stdout.readline())
+
+def test_serve_jobs():
+    """A single worker answers every job in order and survives failures"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'input.png')
+        create_test_image(source)
+
+        worker = subprocess.Popen([sys.executable, SCRIPT, '--serve'],
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            assert json.loads(worker.stdout.readline())['ready'] is True
+
+            plain = send(worker, {'id': 1, 'input': source, 'output': os.path.join(tmp, 'plain.png'),
+                                  'radius': 20, 'unit': 'percent'})
+            assert plain['ok'] and plain['id'] == 1
+            assert Image.open(os.path.join(tmp, 'plain.png')).getpixel((0, 0))[3] == 0
+
+            shadow = send(worker, {'id': 2, 'input_path': source, 'output_path': os.path.join(tmp, 'shadow.png'),
+                                   'radius_value': 12, 'unit': 'px', 'shadow_enabled': True, 'shadow_blur': 6})
+            assert shadow['ok'] and shadow['id'] == 2
+
+            missing = send(worker, {'id': 3, 'input': os.path.join(tmp, 'nope.png'),
+                                    'output': os.path.join(tmp, 'nope-out.png'), 'radius': 5, 'unit': 'px'})
+            assert not missing['ok'] and missing['error']
+
+            unknown = send(worker, {'id': 4, 'input': source, 'output': os.path.join(tmp, 'x.png'),
+                                    'radius': 5, 'unit': 'px', 'colour': 'red'})
+            assert not unknown['ok'] and 'colour' in unknown['error']
+
+            assert send(worker, {'id': 5, 'op': 'shutdown'})['ok']
+            assert worker.wait(timeout=10) == 0
+        finally:
+            if worker.poll() is None:
+                worker.kill()
+
+def test_serve_binary_payloads():
+    """Jobs can carry the encoded input after their line and get the PNG back after the result"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'input.png')
+        create_test_image(source)
+        with open(source, 'rb') as f:
+            encoded = f.read()
+        file_output = os.path.join(tmp, 'file.png')
+
+        worker = subprocess.Popen([sys.executable, SCRIPT, '--serve'],
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            assert json.loads(worker.stdout.readline())['ready'] is True
+            assert send(worker, {'id': 1, 'input': source, 'output': file_output, 'radius': 15, 'unit': 'px'})['ok']
+
+            job = {'id': 2, 'input_bytes': len(encoded), 'output': '-', 'radius': 15, 'unit': 'px'}
+            worker.stdin.write((json.dumps(job) + '\n').encode('utf-8') + encoded)
+            worker.stdin.flush()
+            result = json.loads(worker.stdout.readline())
+            assert result['ok'] and result['id'] == 2 and result['output'] == '-'
+            payload = worker.stdout.read(result['output_bytes'])
+            assert Image.open(io.BytesIO(payload)).tobytes() == Image.open(file_output).tobytes()
+
+            # skip_rounded reads the marker from the payload itself, and an
+            # already-rounded image comes back unchanged
+            with open(file_output, 'rb') as f:
+                rounded = f.read()
+            for data, skipped in ((encoded, False), (rounded, True)):
+                job = {'id': 6, 'input_bytes': len(data), 'output': '-', 'radius': 15, 'unit': 'px',
+                       'skip_rounded': True}
+                worker.stdin.write((json.dumps(job) + '\n').encode('utf-8') + data)
+                worker.stdin.flush()
+                result = json.loads(worker.stdout.readline())
+                assert result['ok'] and result.get('skipped', False) == skipped, result
+                payload = worker.stdout.read(result['output_bytes'])
+                assert Image.open(io.BytesIO(payload)).tobytes() == Image.open(file_output).tobytes()
+                assert payload == rounded or not skipped
+
+            bad = {'id': 3, 'input': source, 'input_bytes': 4, 'output': '-', 'radius': 5, 'unit': 'px'}
+            worker.stdin.write((json.dumps(bad) + '\n').encode('utf-8') + b'abcd')
+            worker.stdin.flush()
+            assert not json.loads(worker.stdout.readline())['ok']
+            assert send(worker, {'id': 4, 'op': 'ping'})['ok']
+            assert send(worker, {'id': 5, 'op': 'shutdown'})['ok']
+            assert worker.wait(timeout=10) == 0
+        finally:
+            if worker.poll() is None:
+                worker.kill()
+
+def test_serve_raw_rgba_frames():
+    """Raw frames match the PNG output's pixels, both inline and through a memory-mapped file"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'input.png')
+        create_test_image(source)
+        png = os.path.join(tmp, 'out.png')
+        frame_file = os.path.join(tmp, 'frame.rgba')
+        options = {'input': source, 'radius': 20, 'unit': 'px', 'shadow_enabled': True, 'border_enabled': True}
+
+        worker = subprocess.Popen([sys.executable, SCRIPT, '--serve'],
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            assert json.loads(worker.stdout.readline())['ready'] is True
+            assert send(worker, dict(options, id=1, output=png))['ok']
+            expected = Image.open(png)
+
+            inline = send(worker, dict(options, id=2, output='-', output_format='rgba'))
+            assert inline['ok'] and (inline['width'], inline['height']) == expected.size
+            assert inline['stride'] == inline['width'] * 4 and inline['output_bytes'] == inline['stride'] * inline['height']
+            assert worker.stdout.read(inline['output_bytes']) == expected.tobytes()
+
+            mapped = send(worker, dict(options, id=3, output=frame_file, output_format='rgba'))
+            assert mapped['ok'] and 'output_bytes' not in mapped
+            with open(frame_file, 'rb') as f:
+                assert f.read() == expected.tobytes()
+
+            assert not send(worker, dict(options, id=4, output='-', output_format='bmp'))['ok']
+            assert send(worker, {'id': 5, 'op': 'shutdown'})['ok']
+            assert worker.wait(timeout=10) == 0
+        finally:
+            if worker.poll() is None:
+                worker.kill()
+
+def test_cli_pipes_stdin_to_stdout():
+    """'-' as input and output pipes the image through without temp files or a SUCCESS line"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'input.png')
+        create_test_image(source)
+        expected = os.path.join(tmp, 'expected.png')
+        args = ['12', 'px', 'true', '#000000', '6', '3', 'true', '#336699', '2', 'dashed']
+        assert subprocess.run([sys.executable, SCRIPT, source, expected, *args], capture_output=True).returncode == 0
+        with open(source, 'rb') as f:
+            result = subprocess.run([sys.executable, SCRIPT, '-', '-', *args], stdin=f, capture_output=True)
+        assert result.returncode == 0
+        assert Image.open(io.BytesIO(result.stdout)).tobytes() == Image.open(expected).tobytes()
+
+        result = subprocess.run([sys.executable, SCRIPT, '-', '-', '10', 'px'], input=b'not an image',
+                                capture_output=True)
+        assert result.returncode == 1 and result.stdout == b'' and b'ERROR' in result.stderr
+
+if __name__ == '__main__':
+    test_serve_jobs()
+    test_serve_binary_payloads()
+    test_serve_raw_rgba_frames()
+    test_cli_pipes_stdin_to_stdout()
+    print("Serve test completed.")
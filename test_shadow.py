@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Test script for the shadow stage.
+Compares the optimised shadow rendering with the original full RGBA blur.
+"""
+
+from PIL import Image, ImageChops, ImageFilter
+import tempfile
+import math
+import os
+
+import round_image
+
+CASES = [
+    ((200, 120), 24, '#000000', 10, 5),
+    ((64, 64), 32, '#800000', 8, 3),
+    ((61, 200), 12, '#3366cc', 25, 12),
+    ((90, 40), 0, '#12ab9f', 3, 0),
+]
+
+def reference_shadow_layer(size, radius, color, blur):
+    """The original shadow: solid-colour RGBA blurred on all channels, pasted through itself"""
+    mask = round_image.rounded_mask(size, radius)
+    shadow = Image.new('RGBA', size, round_image.hex_to_rgb(color) + (255,))
+    shadow.putalpha(mask)
+    shadow = shadow.filter(ImageFilter.GaussianBlur(blur))
+    layer = Image.new('RGBA', size, (0, 0, 0, 0))
+    layer.paste(shadow, (0, 0), shadow)
+    return layer
+
+def max_difference(a, b):
+    """Largest per-channel difference between two images of equal size"""
+    extrema = ImageChops.difference(a, b).getextrema()
+    if a.mode == 'L':
+        return extrema[1]
+    return max(high for _, high in extrema)
+
+def test_alpha_only_blur_matches_rgba_blur():
+    """Blurring only the alpha and colouring it afterwards gives the same pixels"""
+    for size, radius, color, blur, _ in CASES:
+        mask = round_image.rounded_mask(size, radius)
+        alpha = mask.filter(ImageFilter.GaussianBlur(blur))
+        layer = round_image.colorize_shadow(alpha, color)
+        assert max_difference(layer, reference_shadow_layer(size, radius, color, blur)) == 0
+
+def test_corner_shadow_tiles_match_full_blur():
+    """Blurring only the corner tiles reproduces the full-mask blur everywhere"""
+    for size, radius, _, blur, _ in CASES + [((400, 300), 20, '#000000', 2.5, 0), ((300, 200), 3, '#000000', 40, 0)]:
+        tiles = round_image.corner_tiles(size, radius)
+        expected = round_image.rounded_mask(size, radius).filter(ImageFilter.GaussianBlur(blur))
+        actual = Image.new('L', size, 255)
+        for x, y, alpha in round_image.shadow_tiles(size, tiles, blur):
+            actual.paste(alpha, (x, y))
+        assert max_difference(actual, expected) == 0, (size, radius, blur)
+
+def error_stats(a, b):
+    """Return (max, mean) absolute difference between two 'L' images"""
+    histogram = ImageChops.difference(a, b).histogram()
+    mean = sum(level * count for level, count in enumerate(histogram)) / sum(histogram)
+    return max(level for level, count in enumerate(histogram) if count), mean
+
+# Accepted (max, mean) error per quality tier, in 8-bit alpha levels
+TIER_ERROR_LIMITS = {'exact': (0, 0.0), 'fast': (24, 0.5), 'fastest': (32, 0.5)}
+
+def tiled_alpha(size, radius, sigma, quality):
+    """Assemble the full blurred mask from shadow_tiles(), the path apply_effects takes"""
+    alpha = Image.new('L', size, 255)
+    for x, y, tile in round_image.shadow_tiles(size, round_image.corner_tiles(size, radius), sigma, quality):
+        alpha.paste(tile, (x, y))
+    return alpha
+
+def test_shadow_quality_tier_error():
+    """Measure each quality tier's corner tiles against the exact blur and keep it within its limits"""
+    for size, radius, sigma in [((400, 300), 40, 10), ((400, 300), 20, 25), ((800, 600), 100, 60),
+                                ((300, 200), 5, 12), ((400, 300), 100, 6), ((401, 299), 100, 12),
+                                ((1200, 900), 300, 8), ((800, 600), 3, 40), ((300, 200), 40, 16)]:
+        exact = round_image.rounded_mask(size, radius).filter(ImageFilter.GaussianBlur(sigma))
+        for quality, (max_limit, mean_limit) in TIER_ERROR_LIMITS.items():
+            worst, mean = error_stats(tiled_alpha(size, radius, sigma, quality), exact)
+            print(f"  {quality:8s} size={size} radius={radius} sigma={sigma}: max={worst} mean={mean:.3f}")
+            assert worst <= max_limit and mean <= mean_limit, (quality, size, radius, sigma, worst, mean)
+
+def test_shadow_quality_default_is_exact():
+    """apply_effects keeps today's output by default and accepts the faster tiers"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        Image.new('RGB', (240, 160), 'orange').save(source)
+        outputs = {}
+        for quality in (None,) + round_image.SHADOW_QUALITIES:
+            output = os.path.join(tmp, f'{quality}.png')
+            options = {'shadow_quality': quality} if quality else {}
+            round_image.apply_effects(source, output, 15, 'percent', shadow_enabled=True,
+                                      shadow_blur=18, shadow_offset=6, **options)
+            outputs[quality] = Image.open(output)
+        assert outputs[None].tobytes() == outputs['exact'].tobytes()
+        for quality in ('fast', 'fastest'):
+            assert outputs[quality].size == outputs['exact'].size
+            assert max_difference(outputs[quality], outputs['exact']) <= TIER_ERROR_LIMITS[quality][0]
+
+def test_shadow_extends_only_towards_offset():
+    """The shadow widens the output only on the sides it is offset towards"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'in.png')
+        Image.new('RGB', (100, 70), 'teal').save(source)
+        for offset, border, expected in [(6, 0, (106, 76)), (6, 3, (109, 79)), (-8, 2, (110, 80)), (2, 4, (108, 78))]:
+            output = os.path.join(tmp, 'out.png')
+            round_image.apply_effects(source, output, 10, 'px', shadow_enabled=True, shadow_blur=30,
+                                      shadow_offset=offset, border_enabled=bool(border), border_width=border,
+                                      verify_bbox=True)
+            assert Image.open(output).size == expected, (offset, border)
+
+def true_gaussian_blur(mask, sigma):
+    """Reference: exact pixel-integrated Gaussian with edge clamping, computed directly with NumPy"""
+    np = round_image.np
+    values = np.asarray(mask, dtype=np.float64)
+    reach = int(6 * sigma) + 2
+    offsets = np.arange(-reach, reach + 1)
+    cdf = np.array([0.5 * (1 + math.erf(t / (sigma * math.sqrt(2)))) for t in np.r_[offsets - 0.5, reach + 0.5]])
+    kernel = cdf[1:] - cdf[:-1]
+    padded = np.pad(values, reach, mode='edge')
+    rows = np.apply_along_axis(lambda line: np.convolve(line, kernel, mode='same'), 1, padded)
+    both = np.apply_along_axis(lambda line: np.convolve(line, kernel, mode='same'), 0, rows)
+    return both[reach:-reach, reach:-reach]
+
+def analytic_alpha(size, radius, sigma):
+    """Assemble the full blurred mask from the analytic shadow tiles"""
+    alpha = Image.new('L', size, 255)
+    for x, y, tile in round_image.shadow_tiles(size, round_image.corner_tiles(size, radius), sigma, 'analytic'):
+        alpha.paste(tile, (x, y))
+    return alpha
+
+def test_analytic_shadow():
+    """The closed-form shadow equals a true Gaussian; its distance from Pillow's box approximation is bounded"""
+    if round_image.np is None:
+        print("  NumPy not installed, skipping analytic shadow test")
+        return
+    np = round_image.np
+    for size, radius, sigma in [((160, 120), 20, 6), ((200, 90), 10, 15), ((120, 120), 40, 4)]:
+        mask = round_image.rounded_mask(size, radius)
+        alpha = analytic_alpha(size, radius, sigma)
+        reference = true_gaussian_blur(mask, sigma)
+        assert np.abs(np.asarray(alpha, dtype=np.float64) - reference).max() <= 1, (size, radius, sigma)
+
+        # Pillow's three box passes re-clamp at the edges after every pass, so
+        # the two differ most along the image edges next to each corner
+        worst, mean = error_stats(alpha, mask.filter(ImageFilter.GaussianBlur(sigma)))
+        print(f"  analytic size={size} radius={radius} sigma={sigma}: max={worst} mean={mean:.3f}")
+        assert worst <= 64 and mean <= 1.5
+
+def test_analytic_shadow_cost_is_bounded():
+    """Inside render_image() the analytic tier evaluates only the visible pixels, however wide the blur"""
+    if round_image.np is None:
+        print("  NumPy not installed, skipping analytic cost test")
+        return
+    evaluated = []
+    blur = round_image.corner_hole_blur
+    round_image.corner_hole_blur = lambda hole, xs, ys, sigma: evaluated.append(len(xs) * len(ys)) or blur(hole, xs, ys, sigma)
+    try:
+        img = Image.new('RGBA', (800, 600), 'teal')
+        for sigma in (5, 60, 300):
+            evaluated.clear()
+            round_image.render_image(img.copy(), False, 20, 'px', shadow_enabled=True, shadow_blur=sigma,
+                                     shadow_offset=6, shadow_quality='analytic')
+            # At most the four holes over the offset bands and the corner tiles
+            assert 0 < sum(evaluated) <= 4 * (6 * (800 + 600) + 4 * 21 * 21), (sigma, sum(evaluated))
+    finally:
+        round_image.corner_hole_blur = blur
+
+def test_sdf_shadow_cost_is_bounded():
+    """Inside render_image() the SDF renderer's falloff, like the analytic tier, covers only the visible pixels"""
+    if round_image.np is None:
+        print("  NumPy not installed, skipping SDF cost test")
+        return
+    evaluated = []
+    blur = round_image.sdf_hole_blur
+    round_image.sdf_hole_blur = lambda xs, ys, radius, sigma: evaluated.append(xs.size * ys.size) or blur(xs, ys, radius, sigma)
+    try:
+        img = Image.new('RGBA', (800, 600), 'teal')
+        for sigma in (5, 60, 300):
+            evaluated.clear()
+            round_image.render_image(img.copy(), False, 20, 'px', shadow_enabled=True, shadow_blur=sigma,
+                                     shadow_offset=6, renderer='sdf')
+            assert 0 < sum(evaluated) <= 4 * (6 * (800 + 600) + 4 * 21 * 21), (sigma, sum(evaluated))
+    finally:
+        round_image.sdf_hole_blur = blur
+
+def test_sdf_shadow():
+    """The SDF renderer's closed-form shadow stays close to a true Gaussian blur of its own mask"""
+    if round_image.np is None:
+        print("  NumPy not installed, skipping SDF shadow test")
+        return
+    np = round_image.np
+    for size, radius, sigma in [((200, 120), 20, 5), ((64, 64), 32, 10), ((300, 200), 60, 25), ((100, 80), 4, 2)]:
+        mask = round_image.mask_region(round_image.corner_tiles(size, radius, renderer='sdf'), (0, 0) + size)
+        alpha = Image.new('L', size, 255)
+        for x, y, tile in round_image.sdf_shadow_tiles(size, radius, sigma):
+            alpha.paste(tile, (x, y))
+        error = np.abs(np.asarray(alpha, dtype=np.float64) - true_gaussian_blur(mask, sigma))
+        print(f"  sdf      size={size} radius={radius} sigma={sigma}: max={error.max():.0f} mean={error.mean():.3f}")
+        assert error.max() <= 16 and error.mean() <= 2, (size, radius, sigma)
+
+if __name__ == '__main__':
+    test_alpha_only_blur_matches_rgba_blur()
+    test_corner_shadow_tiles_match_full_blur()
+    test_shadow_quality_tier_error()
+    test_shadow_quality_default_is_exact()
+    test_shadow_extends_only_towards_offset()
+    test_analytic_shadow()
+    test_analytic_shadow_cost_is_bounded()
+    test_sdf_shadow_cost_is_bounded()
+    test_sdf_shadow()
+    print("Shadow test completed.")